@@ -0,0 +1,156 @@
+__author__ = 'Manuel'
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+import CircuitGen
+import CircuitRead
+import Spice
+import Timing
+import Transistor
+
+try:
+    import VectorTiming
+except ImportError:
+    VectorTiming = None
+
+tp = Transistor.Transistor(None, "PM1", None, 18.6, 1.2, transistor_type='P', nsub=1e15, lens=3.5, lend=3.9,
+                           nsubsw=2.1e16, nds=1e20, tox=60, xj=0.8, vto=-1.0, ld=0.25, uo=1000, cox=6, level=3)
+tn = Transistor.Transistor(None, "NM1", None, 4.7, 1.2, transistor_type='N', nsub=1e15, lens=3.5, lend=3.9,
+                           nsubsw=2.1e16, nds=1e20, tox=60, xj=0.8, vto=0.8, ld=0.25, uo=1000, cox=12, level=3)
+
+SIZES = (10, 100, 1000, 10000)
+# Path enumeration is skipped when a circuit has more input to output paths than this
+PATH_LIMIT = 100000
+# Every phase is timed REPEAT times and its fastest run kept, timer noise only ever adds
+REPEAT = 5
+# A phase regresses when it gets this much slower than the baseline, and by more than FLOOR seconds
+TOLERANCE = 1.5
+FLOOR = 0.05
+
+
+def count_paths(nodes):
+    # Number of paths calculate_paths would enumerate, counted without enumerating them
+    paths = [0] * len(nodes)
+    for node in nodes.inputs:
+        paths[node.index] = 1
+    for gate in nodes.levelize():
+        paths[gate.outputn.index] = sum(paths[node.index] for node in gate.pins())
+    return sum(paths[node.index] for node in nodes.outputs)
+
+
+def enumerate_paths(nodes):
+    return nodes.organize_by_outputs(nodes.calculate_paths())
+
+
+def all_path_delays(voltage, opaths):
+    cache = CircuitRead.TimingCache()
+    return [[CircuitRead.path_delays(voltage, path, cache) for path in output] for output in opaths]
+
+
+def run_phase(results, phase, function, *args):
+    start = time.perf_counter()
+    value = function(*args)
+    seconds = time.perf_counter() - start
+    results[phase] = min(results.get(phase, seconds), seconds)
+    return value
+
+
+def benchmark(circuit, gates, directory, path_limit=PATH_LIMIT, repeat=REPEAT):
+    netlist = CircuitGen.generate(circuit, gates)
+    address = os.path.join(directory, circuit + str(gates) + '.txt')
+    netlist.write(address)
+
+    results = {'gates': netlist.gates}
+    # Phases build on each other, so every run starts over from the netlist file
+    for i in range(repeat):
+        time_phases(results, address, path_limit)
+    return results
+
+
+def time_phases(results, address, path_limit):
+    voltage, records = run_phase(results, 'parse', CircuitRead.load_circuit, address)
+    nodes = CircuitRead.NodeContainer()
+    gate_list = run_phase(results, 'build', CircuitRead.build_circuit, records, tp, tn, nodes)
+    run_phase(results, 'organize', nodes.organize)
+    analysis = Timing.TimingAnalysis(nodes, voltage)
+    run_phase(results, 'propagate', analysis.propagate)
+    if VectorTiming:
+        vector = run_phase(results, 'vector_pack', VectorTiming.VectorTiming, nodes)
+        run_phase(results, 'vector_propagate', vector.propagate, voltage)
+
+    results['paths'] = count_paths(nodes)
+    if results['paths'] <= path_limit:
+        opaths = run_phase(results, 'enumerate', enumerate_paths, nodes)
+        run_phase(results, 'path_delays', all_path_delays, voltage, opaths)
+
+    run_phase(results, 'spice', Spice.write_deck, address + '.cir', gate_list, voltage)
+
+
+def compare(results, baseline):
+    regressions = []
+    for key, phases in results.items():
+        for phase, seconds in phases.items():
+            if phase in ('gates', 'paths') or phase not in baseline.get(key, {}):
+                continue
+            old = baseline[key][phase]
+            if seconds > old * TOLERANCE and seconds - old > FLOOR:
+                regressions.append((key, phase, old, seconds))
+    return regressions
+
+
+def print_results(results):
+    phases = []
+    for key in results:
+        phases.extend(phase for phase in results[key] if phase not in phases)
+    print('Circuit'.ljust(18) + ''.join(phase.ljust(18) for phase in phases))
+    for key, values in results.items():
+        line = key.ljust(18)
+        for phase in phases:
+            value = values.get(phase, '')
+            if isinstance(value, float):
+                value = '{:.4f}'.format(value)
+            line += str(value).ljust(18)
+        print(line)
+
+
+def main(arguments):
+    parser = argparse.ArgumentParser(description='Times every phase of the analysis on generated circuits.')
+    parser.add_argument('--circuits', default=','.join(sorted(CircuitGen.GENERATORS)))
+    parser.add_argument('--sizes', default=','.join(str(size) for size in SIZES),
+                        help='approximate gate counts, up to 1000000')
+    parser.add_argument('--path-limit', type=int, default=PATH_LIMIT)
+    parser.add_argument('--repeat', type=int, default=REPEAT, help='runs per phase, the fastest one is kept')
+    parser.add_argument('--baseline', help='JSON results to compare against')
+    parser.add_argument('--save', help='file to write the JSON results to')
+    arguments = parser.parse_args(arguments)
+
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for circuit in arguments.circuits.split(','):
+            for gates in arguments.sizes.split(','):
+                key = circuit + '/' + gates
+                results[key] = benchmark(circuit, int(gates), directory, arguments.path_limit, arguments.repeat)
+                print(key + ' done', file=sys.stderr)
+    print_results(results)
+
+    if arguments.save:
+        with open(arguments.save, 'w') as out_file:
+            json.dump(results, out_file, indent=2, sort_keys=True)
+
+    if arguments.baseline:
+        with open(arguments.baseline) as in_file:
+            regressions = compare(results, json.load(in_file))
+        for key, phase, old, new in regressions:
+            print('Regression in ' + key + ' ' + phase + ': {:.4f}s -> {:.4f}s'.format(old, new))
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,165 @@
+__author__ = 'Manuel'
+
+import math
+import random
+
+
+# Netlist in the read_circuit format, built one gate at a time
+class Netlist:
+    def __init__(self, vcc=5):
+        self.vcc = vcc
+        self.lines = []
+        self.gates = 0
+        self.nodes = 0
+
+    def node(self):
+        self.nodes += 1
+        return 'N' + str(self.nodes)
+
+    def gate(self, kind, *inputs):
+        out = self.node()
+        self.gates += 1
+        self.lines.append(' '.join((kind,) + inputs + (out, 'G' + str(self.gates))))
+        return out
+
+    def capacitance(self, node, value):
+        self.lines.append('c' + str(len(self.lines)) + ' ' + node + ' ' + value)
+
+    def outputs(self, nodes, value='50f'):
+        for node in nodes:
+            self.capacitance(node, value)
+
+    def text(self):
+        return 'vcc ' + str(self.vcc) + '\n' + '\n'.join(self.lines) + '\n'
+
+    def write(self, address):
+        with open(address, 'w') as out_file:
+            out_file.write(self.text())
+
+
+def full_adder(netlist, a, b, c):
+    p = netlist.gate('xor', a, b)
+    s = netlist.gate('xor', p, c)
+    g = netlist.gate('and', a, b)
+    t = netlist.gate('and', p, c)
+    return s, netlist.gate('or', g, t)
+
+
+def half_adder(netlist, a, b):
+    return netlist.gate('xor', a, b), netlist.gate('and', a, b)
+
+
+def ripple_carry_adder(bits):
+    netlist = Netlist()
+    carry = 'CIN'
+    sums = []
+    for i in range(bits):
+        s, carry = full_adder(netlist, 'A' + str(i), 'B' + str(i), carry)
+        sums.append(s)
+    netlist.outputs(sums + [carry])
+    return netlist
+
+
+def carry_lookahead_adder(bits):
+    # Kogge-Stone parallel prefix carries over (generate, propagate) pairs
+    netlist = Netlist()
+    p = [netlist.gate('xor', 'A' + str(i), 'B' + str(i)) for i in range(bits)]
+    g = [netlist.gate('and', 'A' + str(i), 'B' + str(i)) for i in range(bits)]
+    g[0] = netlist.gate('or', g[0], netlist.gate('and', p[0], 'CIN'))
+    pp = list(p)
+    distance = 1
+    while distance < bits:
+        new_g = list(g)
+        new_p = list(pp)
+        for i in range(distance, bits):
+            new_g[i] = netlist.gate('or', g[i], netlist.gate('and', pp[i], g[i - distance]))
+            if i >= 2 * distance:
+                new_p[i] = netlist.gate('and', pp[i], pp[i - distance])
+        g = new_g
+        pp = new_p
+        distance *= 2
+    sums = [netlist.gate('xor', p[0], 'CIN')] + [netlist.gate('xor', p[i], g[i - 1]) for i in range(1, bits)]
+    netlist.outputs(sums + [g[-1]])
+    return netlist
+
+
+def array_multiplier(bits):
+    netlist = Netlist()
+    rows = [[netlist.gate('and', 'A' + str(j), 'B' + str(i)) for j in range(bits)] for i in range(bits)]
+    products = [rows[0][0]]
+    partial = rows[0][1:]
+    for row in rows[1:]:
+        carry = None
+        new_partial = []
+        for j, bit in enumerate(row):
+            upper = partial[j] if j < len(partial) else None
+            if upper is None and carry is None:
+                s = bit
+            elif upper is None:
+                s, carry = half_adder(netlist, bit, carry)
+            elif carry is None:
+                s, carry = half_adder(netlist, bit, upper)
+            else:
+                s, carry = full_adder(netlist, bit, upper, carry)
+            new_partial.append(s)
+        new_partial.append(carry)
+        products.append(new_partial[0])
+        partial = new_partial[1:]
+    products.extend(node for node in partial if node)
+    netlist.outputs(products)
+    return netlist
+
+
+def xor_tree(inputs):
+    netlist = Netlist()
+    level = ['X' + str(i) for i in range(inputs)]
+    while len(level) > 1:
+        next_level = [netlist.gate('xor', level[i], level[i + 1]) for i in range(0, len(level) - 1, 2)]
+        if len(level) % 2:
+            next_level.append(level[-1])
+        level = next_level
+    netlist.outputs(level)
+    return netlist
+
+
+def random_dag(gates, inputs=32, width=64, seed=1):
+    # Gates draw their inputs from the last width nodes, which keeps the DAG layered
+    # and gives it plenty of reconvergent fan-out
+    rng = random.Random(seed)
+    netlist = Netlist()
+    nodes = ['I' + str(i) for i in range(inputs)]
+    used = set()
+    for i in range(gates):
+        kind = rng.choice(('nand', 'and', 'or', 'xor', 'inv'))
+        if kind == 'inv':
+            sources = [rng.choice(nodes[-width:])]
+        else:
+            sources = rng.sample(nodes[-width:], 2)
+        used.update(sources)
+        nodes.append(netlist.gate(kind, *sources))
+    netlist.outputs([node for node in nodes[inputs:] if node not in used])
+    return netlist
+
+
+# Circuit name: (generator, gates of the generated circuit for a given size parameter)
+GENERATORS = {'rca': (ripple_carry_adder, lambda bits: 5 * bits),
+              'cla': (carry_lookahead_adder, lambda bits: bits * (3 + 3 * math.log(max(bits, 2), 2))),
+              'multiplier': (array_multiplier, lambda bits: 6 * bits * bits),
+              'xor': (xor_tree, lambda inputs: inputs - 1),
+              'random': (random_dag, lambda gates: gates)}
+
+
+def generate(circuit, gates):
+    # Circuit of the given kind with roughly the given number of gates
+    generator, size_gates = GENERATORS[circuit]
+    size = 2
+    while size_gates(size * 2) <= gates:
+        size *= 2
+    low, high = size, size * 2
+    while high - low > 1:
+        middle = (low + high) // 2
+        if size_gates(middle) <= gates:
+            low = middle
+        else:
+            high = middle
+    return generator(low)
@@ -1,5 +1,9 @@
 __author__ = 'Manuel'
 
+import hashlib
+import os
+import pickle
+
 import Transistor
 import Gates
 
@@ -25,8 +29,9 @@ prefix = {'y': 1e-24,  # yocto
 
 
 class Node:
-    def __init__(self, name):
+    def __init__(self, name, index=None):
         self.name = name
+        self.index = index
         self.output = None
         self.inputs = []
         self.capacitance = 0
@@ -37,6 +42,9 @@ class Node:
     def add_inputs(self, gate):
         self.inputs.append(gate)
 
+    def set_capacitance(self, capacitance):
+        self.capacitance = capacitance
+
     def print(self):
         print("\nNode = " + self.name)
         if self.output:
@@ -56,43 +64,120 @@ class Node:
 class NodeContainer:
     def __init__(self):
         self.nodes = []
+        self.names = {}
         self.inputs = []
         self.outputs = []
+        # Set by levelize, cleared by connect/disconnect
+        self.order = None
+        self.level = []
 
     def add_node(self, node):
-        node_found = False
-        for n in self.nodes:
-            if n.name == node:
-                return n
-        if not node_found:
-            n = Node(node)
+        n = self.names.get(node)
+        if n is None:
+            n = Node(node, len(self.nodes))
             self.nodes.append(n)
-            return n
+            self.names[node] = n
+        return n
+
+    def get_node(self, name):
+        return self.names[name]
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def connect(self, gate, a, b, out):
+        gate.set_nodes(a, b, out)
+        for node in gate.pins():
+            node.add_inputs(gate)
+        out.set_output(gate)
+        self.order = None
+
+    def disconnect(self, gate):
+        for node in gate.pins():
+            node.inputs.remove(gate)
+        if gate.outputn and gate.outputn.output is gate:
+            gate.outputn.set_output(None)
+        self.order = None
 
     def print(self):
         for node in self.nodes:
             node.print()
 
     def organize(self):
+        self.inputs = []
+        self.outputs = []
         for node in self.nodes:
             if not node.output:
                 self.inputs.append(node)
             if not len(node.inputs):
                 self.outputs.append(node)
 
+    def ends(self, nodes, count):
+        # (input, output) state of nodes as organize left it, nodes from index count on are
+        # newer than the last organize and in neither list
+        return dict((node, (node.index < count and not node.output, node.index < count and not node.inputs))
+                    for node in nodes)
+
+    def reorganize(self, ends):
+        # organize for the nodes of an edit only, ends being their state from before it
+        for node, (was_input, was_output) in ends.items():
+            update_end(self.inputs, node, was_input, not node.output)
+            update_end(self.outputs, node, was_output, not node.inputs)
+
+    def topological_gates(self):
+        remaining = {}
+        for node in self.nodes:
+            for gate in node.inputs:
+                remaining[gate] = remaining.get(gate, 0) + 1
+
+        ready = [node for node in self.nodes if not node.output]
+        order = []
+        while ready:
+            node = ready.pop()
+            for gate in node.inputs:
+                remaining[gate] -= 1
+                if not remaining[gate]:
+                    order.append(gate)
+                    if gate.outputn:
+                        ready.append(gate.outputn)
+        return order
+
+    def levelize(self):
+        # Topological gate order and the level of every node, inputs being level 0. Kept
+        # until the netlist is edited, a combinational loop raises ValueError.
+        if self.order is not None:
+            return self.order
+        order = self.topological_gates()
+        gates = set(gate for node in self.nodes for gate in node.inputs)
+        if len(order) < len(gates):
+            loop = find_loop(gates.difference(order))
+            raise ValueError('Combinational loop through gates ' + ' '.join(gate.id for gate in loop))
+        self.level = [0] * len(self.nodes)
+        for gate in order:
+            if gate.outputn:
+                self.level[gate.outputn.index] = max(self.level[node.index] for node in gate.pins()) + 1
+        self.order = order
+        return order
+
     def get_next_nodes(self, node, path, storage):
-        if len(node.inputs):
-            if not path:
-                path = []
-            paths = [path[:] for i in range(len(node.inputs))]
-            for i, gate in enumerate(node.inputs):
-                paths[i].append(gate)
-                self.get_next_nodes(gate.outputn, paths[i], storage)
-        else:
-            storage.append(path)
+        storage.extend(self.walk_paths(node, path))
+
+    def walk_paths(self, node, path=None):
+        # Depth first over the fan-out cone of node with an explicit stack, yielding paths
+        # one at a time. Partial paths are (gate, parent) links and only become lists when
+        # they reach an output, or a gate without an output node.
+        stack = [(node, None)]
+        while stack:
+            node, tail = stack.pop()
+            if node is None or not node.inputs:
+                yield (path if path else []) + unlink(tail)
+                continue
+            for gate in reversed(node.inputs):
+                stack.append((gate.outputn, (gate, tail)))
 
     def calculate_paths(self):
         self.organize()
+        self.levelize()
         paths = []
         for node in self.inputs:
             storage = []
@@ -101,111 +186,212 @@ class NodeContainer:
         return paths
 
     def organize_by_outputs(self, paths):
-        output_paths = []
-        for output_node in self.outputs:
-            output_path = []
-            for input in paths:
-                for path in input:
-                    if path[-1] == output_node.output:
-                        output_path.append(path)
-            output_paths.append(output_path)
+        output_index = dict((node.output, i) for i, node in enumerate(self.outputs) if node.output)
+        output_paths = [[] for node in self.outputs]
+        for input in paths:
+            for path in input:
+                if path and path[-1] in output_index:
+                    output_paths[output_index[path[-1]]].append(path)
         return output_paths
 
 
-def read_circuit(address, tp, tn, nodes):
+def update_end(ends, node, was, end):
+    if end and not was:
+        ends.append(node)
+    elif was and not end:
+        # Edited nodes are mostly the last ones appended, so they are looked for from the end
+        i = len(ends) - 1
+        while ends[i] is not node:
+            i -= 1
+        del ends[i]
+
+
+def unlink(tail):
+    # Gate list of a (gate, parent) linked path, parent first
+    path = []
+    while tail:
+        path.append(tail[0])
+        tail = tail[1]
+    path.reverse()
+    return path
+
+
+def find_loop(gates):
+    # One cycle among gates that topological_gates could not order. Such a gate always
+    # has an input driven by another of them, so walking back from any of them loops.
+    gate = next(iter(gates))
+    seen = {}
+    walk = []
+    while gate not in seen:
+        seen[gate] = len(walk)
+        walk.append(gate)
+        gate = next(node.output for node in gate.pins() if node.output in gates)
+    loop = walk[seen[gate]:]
+    loop.reverse()
+    return loop
+
+
+# Netlist keyword: (gate class, number of input nodes). A gate line lists the
+# input nodes, then the output node and the gate name.
+GATE_TYPES = {'nand': (Gates.Nand, 2),
+              'inv': (Gates.NANDInverter, 1),
+              'and': (Gates.NANDAnd, 2),
+              'or': (Gates.NANDOr, 2),
+              'xor': (Gates.NANDxor, 2)}
+
+# Bump when the record layout changes so old snapshots are not reused
+SNAPSHOT_VERSION = 1
+
+
+def parse_value(value):
+    if value[-1] in prefix:
+        return float(value[:-1]) * prefix[value[-1]]
+    return float(value)
+
+
+def parse_circuit(text):
+    # Turns the netlist text into plain records, in file order:
+    # (keyword, input names, output name, gate name) for gates and ('c', node name, value)
     voltage = None
+    records = []
+    for line in text.splitlines():
+        line = line.split()
+        if not line:
+            continue
+        gate_type = GATE_TYPES.get(line[0])
+        if gate_type:
+            pins = gate_type[1]
+            records.append((line[0], tuple(line[1:pins + 1]), line[pins + 1], line[pins + 2]))
+        elif line[0] == 'vcc':
+            voltage = float(line[1])
+        elif line[0].startswith('c'):
+            records.append(('c', line[1], parse_value(line[2])))
+    return voltage, records
+
+
+def build_circuit(records, tp, tn, nodes):
     gates = []
-
-    with open(address, 'r') as out_file:
-        line = out_file.readline()
-        while line:
-            line = line.split()
-            if line[0] == "vcc":
-                voltage = float(line[1])
-            elif line[0] == 'nand':
-                in1 = nodes.add_node(line[1])
-                in2 = nodes.add_node(line[2])
-                out1 = nodes.add_node(line[3])
-
-                gates.append(Gates.Nand(line[1], line[2], line[3], line[4], tp, tn))
-
-                in1.add_inputs(gates[-1])
-                in2.add_inputs(gates[-1])
-                out1.set_output(gates[-1])
-
-                gates[-1].set_nodes(in1, in2, out1)
-
-            elif line[0] == 'inv':
-                in1 = nodes.add_node(line[1])
-                out1 = nodes.add_node(line[2])
-
-                gates.append(Gates.NANDInverter(line[1], line[2], line[3], tp, tn))
-
-                in1.add_inputs(gates[-1])
-                out1.set_output(gates[-1])
-
-                gates[-1].set_nodes(in1, in1, out1)
-
-            elif line[0] == 'and':
-                in1 = nodes.add_node(line[1])
-                in2 = nodes.add_node(line[2])
-                out1 = nodes.add_node(line[3])
-
-                gates.append(Gates.NANDAnd(line[1], line[2], line[3], line[4], tp, tn))
-
-                in1.add_inputs(gates[-1])
-                in2.add_inputs(gates[-1])
-                out1.set_output(gates[-1])
-
-                gates[-1].set_nodes(in1, in2, out1)
-
-            elif line[0] == 'or':
-                in1 = nodes.add_node(line[1])
-                in2 = nodes.add_node(line[2])
-                out1 = nodes.add_node(line[3])
-
-                gates.append(Gates.NANDOr(line[1], line[2], line[3], line[4], tp, tn))
-
-                in1.add_inputs(gates[-1])
-                in2.add_inputs(gates[-1])
-                out1.set_output(gates[-1])
-
-                gates[-1].set_nodes(in1, in2, out1)
-
-            elif line[0] == 'xor':
-                in1 = nodes.add_node(line[1])
-                in2 = nodes.add_node(line[2])
-                out1 = nodes.add_node(line[3])
-
-                gates.append(Gates.NANDxor(line[1], line[2], line[3], line[4], tp, tn))
-
-                in1.add_inputs(gates[-1])
-                in2.add_inputs(gates[-1])
-                out1.set_output(gates[-1])
-
-                gates[-1].set_nodes(in1, in2, out1)
-
-            elif line[0].startswith('c'):
-                n = nodes.add_node(line[1])
-                if not line[2].isnumeric():
-                    factor = prefix[line[2][-1]]
-                    n.capacitance = float(line[2][:-1]) * factor
-                else:
-                    n.capacitance = float(line[2])
-
-            line = out_file.readline()
-    return voltage, gates
-
-
-def path_delays(vcc, path):
+    for record in records:
+        if record[0] == 'c':
+            nodes.add_node(record[1]).set_capacitance(record[2])
+            continue
+        gate_class = GATE_TYPES[record[0]][0]
+        inputs = [nodes.add_node(name) for name in record[1]]
+        out = nodes.add_node(record[2])
+        gates.append(gate_class(*(record[1] + (record[2], record[3], tp, tn))))
+        nodes.connect(gates[-1], inputs[0], inputs[-1], out)
+    return gates
+
+
+def load_circuit(address, cache_dir=None):
+    # Parsed records of a netlist file. With a cache_dir they are stored in a snapshot
+    # named after the hash of the file contents, and later runs load that instead.
+    with open(address, 'rb') as in_file:
+        content = in_file.read()
+    if not cache_dir:
+        return parse_circuit(content.decode())
+
+    snapshot = os.path.join(cache_dir, hashlib.sha1(content).hexdigest() + '.pickle')
+    if os.path.exists(snapshot):
+        with open(snapshot, 'rb') as in_file:
+            version, voltage, records = pickle.load(in_file)
+        if version == SNAPSHOT_VERSION:
+            return voltage, records
+
+    voltage, records = parse_circuit(content.decode())
+    os.makedirs(cache_dir, exist_ok=True)
+    with open(snapshot + '.tmp', 'wb') as out_file:
+        pickle.dump((SNAPSHOT_VERSION, voltage, records), out_file, pickle.HIGHEST_PROTOCOL)
+    os.replace(snapshot + '.tmp', snapshot)
+    return voltage, records
+
+
+def read_circuit(address, tp, tn, nodes, cache_dir=None):
+    voltage, records = load_circuit(address, cache_dir)
+    return voltage, build_circuit(records, tp, tn, nodes)
+
+
+def gate_load(gate):
+    gate_capacitance = 0
+    for inputs in gate.outputn.inputs:
+        gate_capacitance += inputs.calculate_gc()
+    return gate_capacitance + gate.outputn.capacitance
+
+
+def gate_delay(vcc, gate):
+    return gate.calculate_delay(vcc, gate_load(gate))
+
+
+def path_delays(vcc, path, cache=None):
     total_delay = 0
     for gate in path:
-        gate_capacitance = 0
-        for inputs in gate.outputn.inputs:
-            gate_capacitance += inputs.calculate_gc()
-        total_delay += gate.calculate_delay(vcc, gate_capacitance + gate.outputn.capacitance)
+        if cache:
+            total_delay += cache.delay(vcc, gate)
+        else:
+            total_delay += gate_delay(vcc, gate)
     return total_delay
 
+
+# Memoizes gate loads and (gate, vcc) delays. Edits have to go through
+# set_capacitance/resize, or be reported with the invalidate methods. With a
+# DelayTable.DelayLibrary delays are interpolated from its tables.
+class TimingCache:
+    def __init__(self, library=None):
+        self.library = library
+        self.loads = {}
+        self.delays = {}
+        self.hits = 0
+        self.misses = 0
+
+    def load(self, gate):
+        if gate not in self.loads:
+            self.loads[gate] = gate_load(gate)
+        return self.loads[gate]
+
+    def delay(self, vcc, gate):
+        delays = self.delays.setdefault(gate, {})
+        if vcc in delays:
+            self.hits += 1
+        else:
+            self.misses += 1
+            if self.library:
+                delays[vcc] = self.library.delay(gate, vcc, self.load(gate))
+            else:
+                delays[vcc] = gate.calculate_delay(vcc, self.load(gate))
+        return delays[vcc]
+
+    def invalidate_load(self, gate):
+        self.loads.pop(gate, None)
+        self.delays.pop(gate, None)
+
+    def invalidate_node(self, node):
+        # The capacitance of a node is part of the load of the gate driving it
+        if node.output:
+            self.invalidate_load(node.output)
+
+    def invalidate_gate(self, gate):
+        # A resized gate changes its own delay and the load it puts on its inputs
+        self.invalidate_load(gate)
+        self.invalidate_node(gate.an)
+        self.invalidate_node(gate.bn)
+
+    def set_capacitance(self, node, capacitance):
+        node.set_capacitance(capacitance)
+        self.invalidate_node(node)
+
+    def resize(self, gate, wp, wn):
+        gate.resize(wp, wn)
+        self.invalidate_gate(gate)
+
+    def clear(self):
+        self.loads = {}
+        self.delays = {}
+        self.hits = 0
+        self.misses = 0
+
+    def print(self):
+        print('Hits = ' + str(self.hits) + ', Misses = ' + str(self.misses))
+
 if __name__ == "__main__":
     filepath = '''C:/Users/Manuel/Desktop/test2.txt'''
     tp = Transistor.Transistor(None, "PM1", None, 5*18.6, 1.2, transistor_type='P', nsub=1e15, lens=3.5, lend=3.9,
@@ -0,0 +1,95 @@
+__author__ = 'Manuel'
+
+import bisect
+import os
+import pickle
+
+# Default characterization grid, loads in F and supply voltages in V. Delay grows like
+# 1 / (vcc - threshold) near threshold, so the voltages are uniform in that instead of vcc,
+# from 1.5 V to 6 V for the 1 V threshold of the template cards.
+THRESHOLD = 1.0
+LOADS = [0] + [1e-15 * 10 ** (i / 4) for i in range(17)]
+VOLTAGES = [THRESHOLD + 1 / (2.0 - 1.8 * i / 18) for i in range(19)]
+
+
+def gate_key(gate):
+    # Gates with the same key have the same delay for any load and vcc
+    sizes = []
+    for nand, loads, factor in gate.stages():
+        for n in [nand] + loads:
+            sizes.append((n.sizing.tp.w, n.sizing.tp.l, n.sizing.tn.w, n.sizing.tn.l))
+    sizing = gate.stages()[0][0].sizing
+    return type(gate).__name__, sizing.tp.card.parameters, sizing.tn.card.parameters, tuple(sizes)
+
+
+def interval(axis, value):
+    # Index i of the axis segment [i, i + 1] used for value, the end segments extrapolate
+    return min(max(bisect.bisect_right(axis, value) - 1, 0), len(axis) - 2)
+
+
+# Delay of one kind of gate sampled over a (vcc, load) grid. Samples are stored as
+# delay * (vcc - vt) over u = 1 / (vcc - vt), vt being the larger threshold of the gate,
+# which is close to linear in u and in load, and interpolated bilinearly.
+class DelayTable:
+    def __init__(self, gate, loads=LOADS, voltages=VOLTAGES):
+        sizing = gate.stages()[0][0].sizing
+        self.threshold = max(abs(sizing.tp.vto), abs(sizing.tn.vto))
+        self.loads = list(loads)
+        self.voltages = list(voltages)
+        # Highest voltage first, so u goes up
+        high_first = sorted(self.voltages, reverse=True)
+        self.axis = [1 / (vcc - self.threshold) for vcc in high_first]
+        self.delays = [[gate.calculate_delay(vcc, load) * (vcc - self.threshold) for load in self.loads]
+                       for vcc in high_first]
+
+    def delay(self, vcc, load):
+        scale = vcc - self.threshold
+        u = 1 / scale
+        i = interval(self.axis, u)
+        j = interval(self.loads, load)
+        u0, u1 = self.axis[i], self.axis[i + 1]
+        l0, l1 = self.loads[j], self.loads[j + 1]
+        x = (load - l0) / (l1 - l0)
+        y = (u - u0) / (u1 - u0)
+        row0 = self.delays[i]
+        row1 = self.delays[i + 1]
+        d0 = row0[j] + (row0[j + 1] - row0[j]) * x
+        d1 = row1[j] + (row1[j + 1] - row1[j]) * x
+        return (d0 + (d1 - d0) * y) / scale
+
+
+# Delay tables of every gate kind met so far, characterized on first use
+class DelayLibrary:
+    def __init__(self, loads=LOADS, voltages=VOLTAGES):
+        self.loads = list(loads)
+        self.voltages = list(voltages)
+        self.tables = {}
+
+    def table(self, gate):
+        key = gate_key(gate)
+        if key not in self.tables:
+            self.tables[key] = DelayTable(gate, self.loads, self.voltages)
+        return self.tables[key]
+
+    def delay(self, gate, vcc, load):
+        return self.table(gate).delay(vcc, load)
+
+    def characterize(self, gates):
+        for gate in gates:
+            self.table(gate)
+
+    def save(self, address):
+        with open(address + '.tmp', 'wb') as out_file:
+            pickle.dump((self.loads, self.voltages, self.tables), out_file, pickle.HIGHEST_PROTOCOL)
+        os.replace(address + '.tmp', address)
+
+    def load(self, address):
+        # Keeps the stored tables if they were sampled on the same grid
+        if not os.path.exists(address):
+            return False
+        with open(address, 'rb') as in_file:
+            loads, voltages, tables = pickle.load(in_file)
+        if loads != self.loads or voltages != self.voltages:
+            return False
+        self.tables.update(tables)
+        return True
@@ -3,7 +3,6 @@ __author__ = 'Manuel'
 
 import Transistor
 import math
-import CircuitRead
 
 VCC = 'VCC'
 GND = 'GND'
@@ -16,14 +15,8 @@ class Inverter:
         self.output = output
         self.nodes_tp = [output, input, VCC, VCC]
         self.nodes_tn = [output, input, GND, GND]
-        self.tp = Transistor.Transistor('M' + self.id + 'TP', tp.model, self.nodes_tp, tp.w, tp.l, 'P', tp.level,
-                                         tp.uo, tp.tox, tp.nsub, tp.nsubsw, tp.nds, tp.ld, tp.vto, tp.plambda, tp.lens,
-                                         tp.lend, tp.kp * 1e6, tp.xj * 1e4, tp.pgamma, tp.cox * 1e8, tp.mj,
-                                         tp.mjsw)
-        self.tn = Transistor.Transistor('M' + self.id + 'TN', tn.model, self.nodes_tn, tn.w, tn.l, 'N', tn.level,
-                                         tn.uo, tn.tox, tn.nsub, tn.nsubsw, tn.nds, tn.ld, tn.vto, tn.plambda, tn.lens,
-                                         tn.lend, tn.kp * 1e6, tn.xj * 1e4, tn.pgamma, tn.cox * 1e8, tn.mj,
-                                         tn.mjsw)
+        self.tp = Transistor.Transistor('M' + self.id + 'TP', tp.model, self.nodes_tp, tp.w, tp.l, card=tp.card)
+        self.tn = Transistor.Transistor('M' + self.id + 'TN', tn.model, self.nodes_tn, tn.w, tn.l, card=tn.card)
     def get_eq_wln(self):
         return self.tn.w / self.tn.l
 
@@ -46,8 +39,53 @@ class Inverter:
         spice_string = self.tp.spice_print(False) + '\n' + self.tn.spice_print(False)
         print(spice_string)
 
+    def transistors(self):
+        return [self.tp, self.tn]
 
+    def resize(self, wp, wn):
+        self.tp.set_size(wp, self.tp.l)
+        self.tn.set_size(wn, self.tn.l)
+
+
+# Sizing transistors of a nand and the timing values derived from them, shared by every
+# nand built from the same cards and sizes
+class NandSizing:
+    __slots__ = ('tp', 'tn', 'gc', 'eq_wln', 'eq_wlp', 'int_load')
+
+    def __init__(self, tp, tn):
+        self.tp = tp
+        self.tn = tn
+        self.gc = tp.calculate_cg() + tn.calculate_cg()
+        self.eq_wln = 0.5 * tn.w / tn.l
+        self.eq_wlp = tp.w / tp.l
+        self.int_load = {}
+
+    def int_load_c(self, v1, v2):
+        if (v1, v2) not in self.int_load:
+            cload = 2 * self.tp.calculate_cdb(v1, v2) + 3 * self.tn.calculate_cdb(v1, v2)
+            cload += self.tp.calculate_cg() + self.tn.calculate_cg()
+            self.int_load[(v1, v2)] = cload
+        return self.int_load[(v1, v2)]
+
+    def resized(self, wp, wn):
+        return nand_sizing(self.tp.card, wp, self.tp.l, self.tn.card, wn, self.tn.l)
+
+
+SIZINGS = {}
+
+
+def nand_sizing(p_card, wp, lp, n_card, wn, ln):
+    key = (p_card, wp, lp, n_card, wn, ln)
+    if key not in SIZINGS:
+        SIZINGS[key] = NandSizing(Transistor.Transistor(None, p_card.model, None, wp, lp, card=p_card),
+                                  Transistor.Transistor(None, n_card.model, None, wn, ln, card=n_card))
+    return SIZINGS[key]
+
+
+# Transistors are only built when asked for, timing reads the shared sizing
 class Nand:
+    __slots__ = ('an', 'bn', 'outputn', 'id', 'a', 'b', 'output', 'sizing')
+
     def __init__(self, a, b, output, name, tp, tn):
         self.an = None
         self.bn = None
@@ -57,26 +95,7 @@ class Nand:
         self.a = a
         self.b = b
         self.output = output
-        self.nodes_tp1 = [output, a, VCC, VCC]
-        self.nodes_tp2 = [output, b, VCC, VCC]
-        self.nodes_tn1 = [output, a, self.id + '3N', GND]
-        self.nodes_tn2 = [self.id + '3N', b, GND, GND]
-        self.tp1 = Transistor.Transistor('M' + self.id + 'TP1', tp.model, self.nodes_tp1, tp.w, tp.l, 'P', tp.level,
-                                         tp.uo, tp.tox, tp.nsub, tp.nsubsw, tp.nds, tp.ld, tp.vto, tp.plambda, tp.lens,
-                                         tp.lend, tp.kp * 1e6, tp.xj * 1e4, tp.pgamma, tp.cox * 1e8, tp.mj,
-                                         tp.mjsw)
-        self.tp2 = Transistor.Transistor('M' + self.id + 'TP2', tp.model, self.nodes_tp2, tp.w, tp.l, 'P', tp.level,
-                                         tp.uo, tp.tox, tp.nsub, tp.nsubsw, tp.nds, tp.ld, tp.vto, tp.plambda, tp.lens,
-                                         tp.lend, tp.kp * 1e6, tp.xj * 1e4, tp.pgamma, tp.cox * 1e8, tp.mj,
-                                         tp.mjsw)
-        self.tn1 = Transistor.Transistor('M' + self.id + 'TN1', tn.model, self.nodes_tn1, tn.w, tn.l, 'N', tn.level,
-                                         tn.uo, tn.tox, tn.nsub, tn.nsubsw, tn.nds, tn.ld, tn.vto, tn.plambda, tn.lens,
-                                         tn.lend, tn.kp * 1e6, tn.xj * 1e4, tn.pgamma, tn.cox * 1e8, tn.mj,
-                                         tn.mjsw)
-        self.tn2 = Transistor.Transistor('M' + self.id + 'TN2', tn.model, self.nodes_tn2, tn.w, tn.l, 'N', tn.level,
-                                         tn.uo, tn.tox, tn.nsub, tn.nsubsw, tn.nds, tn.ld, tn.vto, tn.plambda, tn.lens,
-                                         tn.lend, tn.kp * 1e6, tn.xj * 1e4, tn.pgamma, tn.cox * 1e8, tn.mj,
-                                         tn.mjsw)
+        self.sizing = nand_sizing(tp.card, tp.w, tp.l, tn.card, tn.w, tn.l)
 
     def __str__(self):
         return self.id
@@ -84,47 +103,71 @@ class Nand:
     def __repr__(self):
         return str(self)
 
+    @property
+    def tp1(self):
+        return self.transistors()[0]
+
+    @property
+    def tp2(self):
+        return self.transistors()[1]
+
+    @property
+    def tn1(self):
+        return self.transistors()[2]
+
+    @property
+    def tn2(self):
+        return self.transistors()[3]
+
     def calculate_wln_inverter_eq(self, vdd, cload, delay):
-        v_dif = vdd - self.tn1.vto
-        v_div = self.tn1.vto / v_dif
-        f_div = cload / (delay * self.tn1.uo * self.tn1.cox * v_dif)
+        v_dif = vdd - self.sizing.tn.vto
+        v_div = self.sizing.tn.vto / v_dif
+        f_div = cload / (delay * self.sizing.tn.uo * self.sizing.tn.cox * v_dif)
         return f_div * (2 * v_div + math.log(4 * v_dif / vdd - 1))
 
     def calculate_wlp_inverter_eq(self, vdd, cload, delay):
-        v_dif = vdd - abs(self.tp1.vto)
-        v_div = abs(self.tp1.vto) / v_dif
-        f_div = cload / (delay * self.tp1.uo * self.tp1.cox * v_dif)
+        v_dif = vdd - abs(self.sizing.tp.vto)
+        v_div = abs(self.sizing.tp.vto) / v_dif
+        f_div = cload / (delay * self.sizing.tp.uo * self.sizing.tp.cox * v_dif)
         return f_div * (2 * v_div + math.log(4 * v_dif / vdd - 1))
 
     def get_eq_wln(self):
-        return 0.5 * self.tn1.w / self.tn1.l
+        return self.sizing.eq_wln
 
     def get_eq_wlp(self):
-        return self.tp1.w / self.tp1.l
+        return self.sizing.eq_wlp
 
     def calculate_int_loac_c(self, v1, v2):
-        cload = 2 * self.tp1.calculate_cdb(v1, v2) + 3 * self.tn1.calculate_cdb(v1, v2)
-        cload += self.tp1.calculate_cg() + self.tn1.calculate_cg()
-        return cload
+        return self.sizing.int_load_c(v1, v2)
 
     def calculate_tphl(self, vcc, cload):
         cload += self.calculate_int_loac_c(vcc, vcc * 0.5)
-        v_dif = vcc - self.tn1.vto
-        v_div = self.tn1.vto / v_dif
-        f_div = cload / (self.get_eq_wln() * self.tn1.kp * v_dif)
+        v_dif = vcc - self.sizing.tn.vto
+        v_div = self.sizing.tn.vto / v_dif
+        f_div = cload / (self.get_eq_wln() * self.sizing.tn.kp * v_dif)
         return f_div * (2 * v_div + math.log(4 * v_dif / vcc - 1))
 
     def calculate_tplh(self, vcc, cload):
         cload += self.calculate_int_loac_c(0, vcc * 0.5)
-        v_dif = vcc - abs(self.tp1.vto)
-        v_div = abs(self.tp1.vto) / v_dif
-        f_div = cload / (self.get_eq_wlp() * self.tp1.kp * v_dif)
+        v_dif = vcc - abs(self.sizing.tp.vto)
+        v_div = abs(self.sizing.tp.vto) / v_dif
+        f_div = cload / (self.get_eq_wlp() * self.sizing.tp.kp * v_dif)
         return f_div * (2 * v_div + math.log(4 * v_dif / vcc - 1))
 
+    def transistors(self):
+        tp = self.sizing.tp
+        tn = self.sizing.tn
+        nodes_tp1 = [self.output, self.a, VCC, VCC]
+        nodes_tp2 = [self.output, self.b, VCC, VCC]
+        nodes_tn1 = [self.output, self.a, self.id + '3N', GND]
+        nodes_tn2 = [self.id + '3N', self.b, GND, GND]
+        return [Transistor.Transistor('M' + self.id + 'TP1', tp.model, nodes_tp1, tp.w, tp.l, card=tp.card),
+                Transistor.Transistor('M' + self.id + 'TP2', tp.model, nodes_tp2, tp.w, tp.l, card=tp.card),
+                Transistor.Transistor('M' + self.id + 'TN1', tn.model, nodes_tn1, tn.w, tn.l, card=tn.card),
+                Transistor.Transistor('M' + self.id + 'TN2', tn.model, nodes_tn2, tn.w, tn.l, card=tn.card)]
+
     def spice_print(self):
-        spice_string = self.tp1.spice_print(False) + '\n' + self.tp2.spice_print(False) + '\n'
-        spice_string += self.tn1.spice_print(False) + '\n' + self.tn2.spice_print(False)
-        print(spice_string)
+        print('\n'.join(transistor.spice_print(False) for transistor in self.transistors()))
 
     def calculate_delay(self, vcc, c):
         tlh = self.calculate_tplh(vcc, c)
@@ -133,13 +176,28 @@ class Nand:
         return pd
 
     def calculate_gc(self):
-        return self.tp1.calculate_cg() + self.tn1.calculate_cg()
+        return self.sizing.gc
+
+    # Nand stages of the gate as (nand, nands loading it, load factor). A stage without
+    # loading nands drives the gate output.
+    def stages(self):
+        return [(self, [], 1)]
+
+    # Nand whose gate capacitance, times the factor, is the input load of the gate
+    def input_load(self):
+        return self, 1
+
+    def resize(self, wp, wn):
+        self.sizing = self.sizing.resized(wp, wn)
 
     def set_nodes(self, a, b, out):
         self.an = a
         self.bn = b
         self.outputn = out
 
+    def pins(self):
+        return [self.an, self.bn]
+
 
 class NANDAnd:
     def __init__(self, a, b, output, name, tp, tn):
@@ -151,6 +209,9 @@ class NANDAnd:
         self.gate1 = Nand(a, b, name + 'IN', name + 'G1', tp, tn)
         self.gate2 = Nand(name + 'IN', name + 'IN', output, name + 'G2', tp, tn)
 
+    def transistors(self):
+        return self.gate1.transistors() + self.gate2.transistors()
+
     def spice_print(self):
         self.gate1.spice_print()
         self.gate2.spice_print()
@@ -164,11 +225,24 @@ class NANDAnd:
     def calculate_gc(self):
         return self.gate1.calculate_gc()
 
+    def stages(self):
+        return [(self.gate1, [self.gate2], 2), (self.gate2, [], 1)]
+
+    def input_load(self):
+        return self.gate1, 1
+
+    def resize(self, wp, wn):
+        self.gate1.resize(wp, wn)
+        self.gate2.resize(wp, wn)
+
     def set_nodes(self, a, b, out):
         self.an = a
         self.bn = b
         self.outputn = out
 
+    def pins(self):
+        return [self.an, self.bn]
+
     def __str__(self):
         return self.id
 
@@ -187,6 +261,9 @@ class NANDOr:
         self.gate2 = Nand(b, b, name + 'IN2', name + 'G2', tp, tn)
         self.gate3 = Nand(name + 'IN2', name + 'IN1', output, name + 'G3', tp, tn)
 
+    def transistors(self):
+        return self.gate1.transistors() + self.gate2.transistors() + self.gate3.transistors()
+
     def spice_print(self):
         self.gate1.spice_print()
         self.gate2.spice_print()
@@ -197,9 +274,23 @@ class NANDOr:
         self.bn = b
         self.outputn = out
 
+    def pins(self):
+        return [self.an, self.bn]
+
     def calculate_gc(self):
         return 2 * self.gate1.calculate_gc()
 
+    def stages(self):
+        return [(self.gate1, [self.gate3], 1), (self.gate3, [], 1)]
+
+    def input_load(self):
+        return self.gate1, 2
+
+    def resize(self, wp, wn):
+        self.gate1.resize(wp, wn)
+        self.gate2.resize(wp, wn)
+        self.gate3.resize(wp, wn)
+
     def calculate_delay(self, vcc, c):
         gate3_c = self.gate3.calculate_gc()
         gate1_delay = self.gate1.calculate_delay(vcc, gate3_c)
@@ -225,6 +316,10 @@ class NANDxor:
         self.gate3 = Nand(b, name + 'IN1', name + 'IN3', name + 'G3', tp, tn)
         self.gate4 = Nand(name + 'IN3', name + 'IN2', output, name + 'G4', tp, tn)
 
+    def transistors(self):
+        return (self.gate1.transistors() + self.gate2.transistors() + self.gate3.transistors() +
+                self.gate4.transistors())
+
     def spice_print(self):
         self.gate1.spice_print()
         self.gate2.spice_print()
@@ -236,9 +331,25 @@ class NANDxor:
         self.bn = b
         self.outputn = out
 
+    def pins(self):
+        return [self.an, self.bn]
+
     def calculate_gc(self):
         return 2 * self.gate1.calculate_gc()
 
+    def stages(self):
+        # Mirrors calculate_delay, which times the second stage with gate1
+        return [(self.gate1, [self.gate2, self.gate3], 1), (self.gate1, [self.gate4], 1), (self.gate4, [], 1)]
+
+    def input_load(self):
+        return self.gate1, 2
+
+    def resize(self, wp, wn):
+        self.gate1.resize(wp, wn)
+        self.gate2.resize(wp, wn)
+        self.gate3.resize(wp, wn)
+        self.gate4.resize(wp, wn)
+
     def calculate_delay(self, vcc, c):
         gate2_3_c = self.gate2.calculate_gc() + self.gate3.calculate_gc()
         gate1_delay = self.gate1.calculate_delay(vcc, gate2_3_c)
@@ -263,20 +374,35 @@ class NANDInverter:
         self.id = name
         self.gate1 = Nand(a, a, output, name + 'G1', tp, tn)
 
+    def transistors(self):
+        return self.gate1.transistors()
+
     def spice_print(self):
         self.gate1.spice_print()
 
     def calculate_gc(self):
         return 2 * self.gate1.calculate_gc()
 
+    def stages(self):
+        return [(self.gate1, [], 1)]
+
+    def input_load(self):
+        return self.gate1, 2
+
     def calculate_delay(self, vcc, c):
         return self.gate1.calculate_delay(vcc, c)
 
+    def resize(self, wp, wn):
+        self.gate1.resize(wp, wn)
+
     def set_nodes(self, a, b, out):
         self.an = a
         self.bn = b
         self.outputn = out
 
+    def pins(self):
+        return [self.an]
+
     def __str__(self):
         return self.id
 
@@ -0,0 +1,112 @@
+__author__ = 'Manuel'
+
+import concurrent.futures
+
+import numpy as np
+
+import Transistor
+import VectorTiming
+
+# One sigma of every varied parameter, absolute (V) for vto and relative for the rest.
+# vto, tox, ld and uo are drawn once per card and sample, w and l once per nand and sample.
+SIGMAS = {'vto': 0.03, 'tox': 0.02, 'ld': 0.05, 'uo': 0.05, 'w': 0.02, 'l': 0.02}
+PERCENTILES = (1, 50, 99, 99.9)
+
+# MonteCarlo instance of a worker process
+worker = None
+
+
+def vary_card(card, dvto, dtox, dld, duo):
+    parameters = dict(zip(Transistor.CARD_PARAMETERS, card.parameters))
+    tox = card.tox * (1 + dtox)
+    changes = {'vto': card.vto + dvto, 'tox': tox, 'ld': card.ld * (1 + dld), 'uo': card.uo * (1 + duo)}
+    # Values given explicitly on the card do not follow tox and uo on their own
+    if parameters['cox']:
+        changes['cox'] = parameters['cox'] * card.tox / tox
+    if parameters['kp']:
+        changes['kp'] = parameters['kp'] * (1 + duo) * card.tox / tox
+    return card.replace(**changes)
+
+
+def set_worker(monte_carlo):
+    global worker
+    worker = monte_carlo
+
+
+def simulate(seed, size):
+    return worker.simulate(seed, size)
+
+
+class MonteCarlo:
+    def __init__(self, timing, vcc, sigmas=None, outputs=None):
+        self.timing = timing
+        self.vcc = vcc
+        self.sigmas = dict(SIGMAS)
+        if sigmas:
+            self.sigmas.update(sigmas)
+        if outputs:
+            self.outputs = list(outputs)
+        else:
+            self.outputs = list(timing.nodes.outputs)
+        self.output_index = np.array([node.index for node in self.outputs], dtype=np.intp)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['outputs'] = None
+        return state
+
+    def sample_transistors(self, rng, cards, index, w, l, size):
+        s = self.sigmas
+        d = rng.standard_normal((4, size, len(cards)))
+        varied = [vary_card(card, s['vto'] * d[0, m, k], s['tox'] * d[1, m, k], s['ld'] * d[2, m, k],
+                            s['uo'] * d[3, m, k]) for m in range(size) for k, card in enumerate(cards)]
+        table = VectorTiming.card_table(varied)
+        t = VectorTiming.take(dict((key, value.reshape(size, len(cards))) for key, value in table.items()), index)
+        t['w'] = w * (1 + s['w'] * rng.standard_normal((size, len(w))))
+        t['l'] = l * (1 + s['l'] * rng.standard_normal((size, len(l))))
+        return t
+
+    def simulate(self, seed, size):
+        # Delays of the chosen outputs for size samples, as a (sample, output) array
+        rng = np.random.default_rng(seed)
+        vt = self.timing
+        p = self.sample_transistors(rng, vt.p_cards, vt.p_card, vt.wp, vt.lp, size)
+        n = self.sample_transistors(rng, vt.n_cards, vt.n_card, vt.wn, vt.ln, size)
+        return vt.propagate(self.vcc, p, n)[:, self.output_index]
+
+    def run(self, samples, seed=0, processes=None, chunk=256):
+        # Chunks get their own seeds, so results do not depend on the number of processes
+        sizes = [min(chunk, samples - start) for start in range(0, samples, chunk)]
+        seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+        if processes == 1:
+            results = [self.simulate(s, size) for s, size in zip(seeds, sizes)]
+        else:
+            with concurrent.futures.ProcessPoolExecutor(processes, initializer=set_worker,
+                                                        initargs=(self,)) as pool:
+                results = list(pool.map(simulate, seeds, sizes))
+        if not results:
+            return np.zeros((0, len(self.output_index)))
+        return np.concatenate(results)
+
+    def report(self, delays, target=None):
+        result = {'samples': len(delays),
+                  'mean': delays.mean(axis=0),
+                  'std': delays.std(axis=0),
+                  'percentiles': dict((p, np.percentile(delays, p, axis=0)) for p in PERCENTILES)}
+        if target is not None:
+            # A sample passes when every output meets the target
+            result['yield'] = np.mean(np.all(delays <= target, axis=1))
+        return result
+
+    def print_report(self, delays, target=None):
+        result = self.report(delays, target)
+        print('Samples = ' + str(result['samples']))
+        print('Node'.ljust(14) + 'Mean'.ljust(14) + 'Std'.ljust(14) +
+              ''.join(('P' + str(p)).ljust(14) for p in PERCENTILES))
+        for i, node in enumerate(self.outputs):
+            line = str(node).ljust(14) + '{:.4E}'.format(result['mean'][i]).ljust(14)
+            line += '{:.4E}'.format(result['std'][i]).ljust(14)
+            line += ''.join('{:.4E}'.format(result['percentiles'][p][i]).ljust(14) for p in PERCENTILES)
+            print(line)
+        if target is not None:
+            print('Yield = {:.2f}%'.format(100 * result['yield']))
@@ -0,0 +1,420 @@
+__author__ = 'Manuel'
+
+import gc
+import os
+
+import CircuitRead
+
+# Supply voltage of imported netlists, BLIF and Verilog do not carry one
+VCC = 5
+
+# Verilog primitives: (gate built over the inputs, inverted output)
+PRIMITIVES = {'and': ('and', False),
+              'nand': ('and', True),
+              'or': ('or', False),
+              'nor': ('or', True),
+              'xor': ('xor', False),
+              'xnor': ('xor', True),
+              'buf': (None, False),
+              'not': (None, True)}
+
+# Common BLIF covers by their sorted planes: (gate built over the inputs, inverted output)
+COVERS = {('1',): ('and', False),
+          ('0',): ('and', True),
+          ('11',): ('and', False),
+          ('00',): ('or', True),
+          ('-1', '1-'): ('or', False),
+          ('01', '10'): ('xor', False),
+          ('00', '11'): ('xor', True)}
+
+VERILOG_PUNCTUATION = '()[]:;,=~&|^{}#'
+VERILOG_DECLARATIONS = ('input', 'output', 'wire', 'reg', 'supply0', 'supply1')
+
+
+# Collects parse_circuit style records for a netlist made of wider or inverted gates.
+# Gates become balanced trees of 2 input and/or/xor gates plus inverters, buffers of internal
+# signals become aliases, so every node keeps the name it has in the source where it can.
+class NetlistBuilder:
+    def __init__(self):
+        self.records = []
+        self.aliases = {}
+        self.inverted = {}
+        # Instance names of buffers, kept for the gate that drives an aliased output
+        self.names = {}
+        self.count = 0
+
+    def node(self, base):
+        self.count += 1
+        return base + '$' + str(self.count)
+
+    def gate(self, kind, inputs, out, name=None):
+        self.records.append((kind, tuple(inputs), out, name if name else out + '$'))
+        return out
+
+    def inverse(self, signal):
+        # Inverters of the same signal are shared
+        if signal not in self.inverted:
+            self.inverted[signal] = self.gate('inv', (signal,), self.node(signal))
+        return self.inverted[signal]
+
+    def alias(self, out, signal, name=None):
+        self.aliases[out] = signal
+        if name:
+            self.names[out] = name
+
+    def tree(self, kind, inputs, out, name=None, invert=False):
+        # Balanced tree of 2 input kind gates over inputs driving out. An inverted and tree
+        # ends in a nand, inverted or/xor trees in an inverter.
+        level = list(inputs)
+        while len(level) > 2:
+            next_level = [self.gate(kind, level[i:i + 2], self.node(out)) for i in range(0, len(level) - 1, 2)]
+            if len(level) % 2:
+                next_level.append(level[-1])
+            level = next_level
+        if len(level) == 1:
+            if invert:
+                return self.gate('inv', level, out, name)
+            self.alias(out, level[0], name)
+            return out
+        if invert and kind == 'and':
+            return self.gate('nand', level, out, name)
+        if invert:
+            return self.gate('inv', (self.gate(kind, level, self.node(out)),), out, name)
+        return self.gate(kind, level, out, name)
+
+    def primitive(self, primitive, inputs, out, name=None):
+        kind, invert = PRIMITIVES[primitive]
+        if kind is None and len(inputs) != 1:
+            raise ValueError(primitive + ' gate ' + str(name) + ' has ' + str(len(inputs)) + ' inputs')
+        return self.tree(kind, inputs, out, name, invert)
+
+    def cover(self, inputs, cubes, out):
+        # Sum of products of a BLIF .names cover, cubes being (input plane, output value)
+        if not cubes:
+            return out
+        value = cubes[0][1]
+        planes = [plane for plane, plane_value in cubes if plane_value == value]
+        if len(planes) != len(cubes):
+            raise ValueError('Cover of ' + out + ' mixes on-set and off-set cubes')
+        invert = value == '0'
+        key = tuple(sorted(planes))
+        if key in COVERS and len(key[0]) == len(inputs):
+            kind, inverted = COVERS[key]
+            return self.tree(kind, inputs, out, invert=inverted != invert)
+        if any(len(plane) != len(inputs) for plane in planes):
+            raise ValueError('Cover of ' + out + ' does not match its ' + str(len(inputs)) + ' inputs')
+        if not inputs or any(plane.count('-') == len(plane) for plane in planes):
+            # Constant, left undriven like a primary input
+            return out
+        if len(planes) == 1 and planes[0].count('1') == len(inputs):
+            return self.tree('and', inputs, out, invert=invert)
+        if len(planes) == 1 and planes[0].count('0') == len(inputs):
+            # A nor, an and of inverted inputs
+            return self.tree('or', inputs, out, invert=not invert)
+
+        terms = []
+        for plane in planes:
+            literals = [signal if bit == '1' else self.inverse(signal)
+                        for signal, bit in zip(inputs, plane) if bit != '-']
+            terms.append(literals[0] if len(literals) == 1 else self.tree('and', literals, self.node(out)))
+        return self.tree('or', terms, out, invert=invert)
+
+    def resolve(self, signal):
+        while signal in self.aliases:
+            signal = self.aliases[signal]
+        return signal
+
+    def result(self, outputs=(), output_load=None):
+        # Declared outputs stay nodes of their own, only internal signals are aliased away
+        targets = {}
+        for out in outputs:
+            if out in self.aliases:
+                targets[out] = self.aliases.pop(out)
+        records = []
+        for record in self.records:
+            records.append((record[0], tuple(self.resolve(signal) for signal in record[1]), record[2], record[3]))
+        if targets:
+            self.drive_outputs(records, dict((out, self.resolve(signal)) for out, signal in targets.items()))
+        if output_load is not None:
+            records.extend(('c', self.resolve(out), output_load) for out in outputs)
+        return records
+
+    def drive_outputs(self, records, targets):
+        # An output aliased to a gate no other gate reads takes that gate over, one aliased to a
+        # shared inverter gets its own inverter and any other one a buffer of two inverters
+        read = set(signal for record in records for signal in record[1])
+        drivers = dict((record[2], i) for i, record in enumerate(records) if record[0] != 'c')
+        sources = dict((inverter, signal) for signal, inverter in self.inverted.items())
+        renamed = {}
+        for out, signal in targets.items():
+            if signal in drivers and signal not in read and signal not in targets and signal not in renamed:
+                record = records[drivers[signal]]
+                name = record[3] if record[3] != signal + '$' else out + '$'
+                records[drivers[signal]] = record[:2] + (out, self.names.get(out, name))
+                renamed[signal] = out
+        for out, signal in targets.items():
+            if renamed.get(signal) == out:
+                continue
+            if signal in sources:
+                inputs = (self.resolve(sources[signal]),)
+            else:
+                signal = renamed.get(signal, signal)
+                if signal not in self.inverted:
+                    self.inverse(signal)
+                    records.append(self.records[-1])
+                inverter = self.inverted[signal]
+                inputs = (renamed.get(inverter, inverter),)
+            records.append(('inv', inputs, out, self.names.get(out, out + '$')))
+
+
+def parse_blif(text, output_load=None, vcc=VCC):
+    # Combinational BLIF: .names covers become gates, a .latch cuts the loop, its output
+    # becomes a primary input. Only the first .model is read.
+    builder = NetlistBuilder()
+    outputs = []
+    text = text.replace('\\\n', ' ')
+    if '#' in text:
+        text = '\n'.join(line.split('#', 1)[0] for line in text.split('\n'))
+    lines = [line.split() for line in text.split('\n')]
+    i = 0
+    while i < len(lines):
+        line = lines[i]
+        i += 1
+        if not line:
+            continue
+        keyword = line[0]
+        if keyword == '.names':
+            cubes = []
+            while i < len(lines) and (not lines[i] or lines[i][0][0] != '.'):
+                cube = lines[i]
+                i += 1
+                if cube:
+                    cubes.append((cube[0], cube[1]) if len(cube) > 1 else ('', cube[0]))
+            builder.cover(line[1:-1], cubes, line[-1])
+        elif keyword == '.outputs':
+            outputs.extend(line[1:])
+        elif keyword == '.end':
+            break
+        elif keyword in ('.subckt', '.gate', '.mlatch'):
+            raise ValueError('Unsupported BLIF construct ' + keyword)
+    return vcc, builder.result(outputs, output_load)
+
+
+def verilog_tokens(text):
+    # Comments out, punctuation spaced out, then one split for the whole file
+    if '/*' in text:
+        parts = text.split('/*')
+        text = parts[0] + ' ' + ' '.join(part.split('*/', 1)[1] if '*/' in part else '' for part in parts[1:])
+    if '//' in text:
+        text = '\n'.join(line.split('//', 1)[0] for line in text.split('\n'))
+    for character in VERILOG_PUNCTUATION:
+        if character in text:
+            text = text.replace(character, ' ' + character + ' ')
+    return text.split()
+
+
+def verilog_statements(tokens):
+    statement = []
+    for token in tokens:
+        if token in ('endmodule', 'begin', 'end'):
+            continue
+        if token == ';':
+            yield statement
+            statement = []
+        else:
+            statement.append(token)
+
+
+# Recursive descent over the right hand side of an assign, ~ binds tightest, then &, ^ and |
+class Expression:
+    def __init__(self, builder, tokens, out):
+        self.builder = builder
+        self.tokens = tokens
+        self.position = 0
+        self.out = out
+
+    def peek(self):
+        return self.tokens[self.position] if self.position < len(self.tokens) else None
+
+    def take(self):
+        self.position += 1
+        return self.tokens[self.position - 1]
+
+    def operands(self, operator, operand):
+        terms = [operand()]
+        while self.peek() == operator:
+            self.take()
+            terms.append(operand())
+        return terms
+
+    def binary(self, kind, operator, operand):
+        terms = self.operands(operator, operand)
+        if len(terms) == 1:
+            return terms[0]
+        return self.builder.tree(kind, terms, self.builder.node(self.out))
+
+    def parse(self):
+        signal = self.disjunction()
+        if self.position != len(self.tokens):
+            raise ValueError('Cannot parse assign to ' + self.out + ': ' + ' '.join(self.tokens))
+        # The last gate built is the top of the expression, it drives the assigned node itself
+        records = self.builder.records
+        if records and records[-1][2] == signal and signal.startswith(self.out + '$'):
+            records[-1] = records[-1][:2] + (self.out, self.out + '$')
+        else:
+            self.builder.alias(self.out, signal)
+        return self.out
+
+    def disjunction(self):
+        return self.binary('or', '|', self.xor)
+
+    def xor(self):
+        return self.binary('xor', '^', self.conjunction)
+
+    def conjunction(self):
+        return self.binary('and', '&', self.unary)
+
+    def unary(self):
+        token = self.take()
+        if token == '~':
+            return self.builder.inverse(self.unary())
+        if token == '(':
+            signal = self.disjunction()
+            if self.take() != ')':
+                raise ValueError('Unbalanced parenthesis in assign to ' + self.out)
+            return signal
+        return signal_name(token, self)
+
+
+def signal_name(token, stream):
+    # Bit selects come tokenized as name [ index ] and are put back together
+    if stream.peek() == '[':
+        stream.take()
+        index = stream.take()
+        stream.take()
+        return token + '[' + index + ']'
+    return token
+
+
+# Token list with the same peek/take interface as Expression, for port lists
+class TokenStream:
+    def __init__(self, tokens):
+        self.tokens = tokens
+        self.position = 0
+
+    def peek(self):
+        return self.tokens[self.position] if self.position < len(self.tokens) else None
+
+    def take(self):
+        self.position += 1
+        return self.tokens[self.position - 1]
+
+
+def parse_verilog(text, output_load=None, vcc=VCC):
+    # Gate level Verilog: and/nand/or/nor/xor/xnor/buf/not primitive instances and assign
+    # statements over ~ & ^ | expressions. Instances of other modules are rejected.
+    builder = NetlistBuilder()
+    outputs = []
+    for statement in verilog_statements(verilog_tokens(text)):
+        if not statement:
+            continue
+        keyword = statement[0]
+        if keyword == 'module':
+            outputs.extend(header_outputs(statement))
+            continue
+        if keyword in VERILOG_DECLARATIONS:
+            if keyword == 'output':
+                outputs.extend(declared_names(statement[1:]))
+            continue
+        if keyword == 'assign':
+            stream = TokenStream(statement[1:])
+            out = signal_name(stream.take(), stream)
+            if stream.take() != '=':
+                raise ValueError('Cannot parse assign to ' + out)
+            Expression(builder, statement[1 + stream.position:], out).parse()
+            continue
+        if keyword not in PRIMITIVES:
+            raise ValueError('Unsupported Verilog statement ' + ' '.join(statement[:4]))
+
+        stream = TokenStream(statement[1:])
+        if stream.peek() == '#':
+            # Delay, #1 or a balanced #( ... ) group
+            stream.take()
+            depth = 0
+            while True:
+                if stream.peek() is None:
+                    raise ValueError('Unbalanced delay in ' + keyword + ' statement')
+                token = stream.take()
+                depth += {'(': 1, ')': -1}.get(token, 0)
+                if not depth:
+                    break
+        while stream.peek() is not None:
+            name = None
+            if stream.peek() != '(':
+                name = stream.take()
+            stream.take()
+            pins = []
+            while stream.peek() != ')':
+                token = stream.take()
+                if token != ',':
+                    pins.append(signal_name(token, stream))
+            stream.take()
+            if stream.peek() == ',':
+                stream.take()
+            builder.primitive(keyword, pins[1:], pins[0], name)
+    return vcc, builder.result(outputs, output_load)
+
+
+def header_outputs(tokens):
+    # Outputs declared in an ANSI style module header, module m(input a, output [1:0] y)
+    outputs = []
+    direction = None
+    declaration = []
+    for token in tokens + ['input']:
+        if token in ('input', 'output', 'inout'):
+            if direction == 'output':
+                outputs.extend(declared_names(declaration))
+            direction = token
+            declaration = []
+        elif token not in ('(', ')'):
+            declaration.append(token)
+    return outputs
+
+
+def declared_names(tokens):
+    # Names of a declaration, a [msb:lsb] range expands into one name per bit
+    names = []
+    bits = None
+    i = 0
+    while i < len(tokens):
+        token = tokens[i]
+        if token == '[':
+            msb, lsb = int(tokens[i + 1]), int(tokens[i + 3])
+            bits = range(min(msb, lsb), max(msb, lsb) + 1)
+            i += 5
+            continue
+        if token not in (',', 'wire', 'reg'):
+            names.extend([token + '[' + str(bit) + ']' for bit in bits] if bits else [token])
+        i += 1
+    return names
+
+
+PARSERS = {'.blif': parse_blif, '.v': parse_verilog}
+
+
+def import_circuit(address, tp, tn, nodes, output_load=None, vcc=VCC):
+    # Reads a BLIF or Verilog file, picked by extension, into nodes like read_circuit
+    parser = PARSERS.get(os.path.splitext(address)[1].lower())
+    if not parser:
+        raise ValueError('Unknown netlist format ' + address)
+    # Millions of small tuples and lists would set off the cyclic collector over and over,
+    # none of them is garbage until the import is done
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        with open(address) as in_file:
+            voltage, records = parser(in_file.read(), output_load, vcc)
+        return voltage, CircuitRead.build_circuit(records, tp, tn, nodes)
+    finally:
+        if enabled:
+            gc.enable()
@@ -0,0 +1,181 @@
+__author__ = 'Manuel'
+
+import concurrent.futures
+import copy
+import os
+from multiprocessing import shared_memory
+
+import numpy as np
+
+import DelayTable
+import Topology
+
+# ConeTiming of a worker process and the shared memory blocks it reads
+worker = None
+blocks = []
+
+# Topology arrays the workers need, plus the kind of every gate
+SHARED = ('fanin_offsets', 'fanin', 'fanout_offsets', 'fanout', 'out', 'driver', 'capacitance', 'kind')
+
+
+def prototype(gate):
+    # Copy of the gate without its nodes, so it pickles on its own
+    gate = copy.copy(gate)
+    gate.set_nodes(None, None, None)
+    return gate
+
+
+def share(arrays):
+    # Copies the arrays into new shared memory blocks, returns the blocks and what attach needs
+    shared = []
+    specs = {}
+    for key, array in arrays.items():
+        block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+        np.ndarray(array.shape, array.dtype, block.buf)[:] = array
+        shared.append(block)
+        specs[key] = (block.name, array.dtype.str, len(array))
+    return shared, specs
+
+
+def attach(specs, prototypes, vcc):
+    global worker
+    arrays = {}
+    for key, (name, dtype, length) in specs.items():
+        block = shared_memory.SharedMemory(name=name)
+        blocks.append(block)
+        arrays[key] = np.ndarray(length, dtype, block.buf)
+    worker = ConeTiming(arrays, prototypes, vcc)
+
+
+def time_outputs(outputs):
+    return worker.time_outputs(outputs)
+
+
+# Times the fan-in cone of a group of outputs. Gates are integers in topological order
+# and every gate kind has a prototype gate, so the delays are the ones the gates
+# themselves would give, computed in the same order as TimingAnalysis. Arrivals are
+# final once computed, so cones of later groups stop at nodes timed before.
+class ConeTiming:
+    def __init__(self, arrays, prototypes, vcc):
+        # memoryviews index to plain Python numbers, which keeps the scalar loops fast
+        self.views = dict((key, memoryview(array)) for key, array in arrays.items())
+        self.prototypes = prototypes
+        self.vcc = vcc
+        self.input_c = [gate.calculate_gc() for gate in prototypes]
+        self.arrival = {}
+        # (kind, load): delay
+        self.delays = {}
+
+    def cone(self, outputs):
+        driver = self.views['driver']
+        fanin_offsets = self.views['fanin_offsets']
+        fanin = self.views['fanin']
+        out = self.views['out']
+        gates = set()
+        stack = [driver[node] for node in outputs if driver[node] >= 0]
+        while stack:
+            gate = stack.pop()
+            if gate in gates or out[gate] in self.arrival:
+                continue
+            gates.add(gate)
+            for node in fanin[fanin_offsets[gate]:fanin_offsets[gate + 1]]:
+                if driver[node] >= 0 and driver[node] not in gates:
+                    stack.append(driver[node])
+        return sorted(gates)
+
+    def time_outputs(self, outputs):
+        # (arrival, critical path gates) of every output
+        v = self.views
+        fanin_offsets, fanin, fanout_offsets, fanout = v['fanin_offsets'], v['fanin'], v['fanout_offsets'], v['fanout']
+        out, driver, capacitance, kind = v['out'], v['driver'], v['capacitance'], v['kind']
+        arrival = self.arrival
+        delays = self.delays
+        for gate in self.cone(outputs):
+            node = out[gate]
+            load = 0
+            for loading in fanout[fanout_offsets[node]:fanout_offsets[node + 1]]:
+                load += self.input_c[kind[loading]]
+            load += capacitance[node]
+            key = (kind[gate], load)
+            if key not in delays:
+                delays[key] = self.prototypes[kind[gate]].calculate_delay(self.vcc, load)
+            delay = delays[key]
+            a = arrival.get(fanin[fanin_offsets[gate]], 0)
+            b = arrival.get(fanin[fanin_offsets[gate + 1] - 1], 0)
+            arrival[node] = max(a, b) + delay
+
+        results = []
+        for node in outputs:
+            path = []
+            gate = driver[node]
+            while gate >= 0:
+                path.append(gate)
+                a = fanin[fanin_offsets[gate]]
+                b = fanin[fanin_offsets[gate + 1] - 1]
+                gate = driver[b if arrival.get(b, 0) > arrival.get(a, 0) else a]
+            path.reverse()
+            results.append((arrival.get(node, 0), path))
+        return results
+
+
+# Block based timing split into output cones that run in a process pool. The topology
+# goes to the workers once, through shared memory, and the merged report is the same
+# as the one of TimingAnalysis.
+class ParallelTiming:
+    def __init__(self, nodes, vcc):
+        nodes.organize()
+        self.nodes = nodes
+        self.vcc = vcc
+        self.gates = nodes.levelize()
+        self.topology = Topology.Topology.from_nodes(nodes, self.gates)
+
+        kinds = {}
+        self.prototypes = []
+        kind = []
+        for gate in self.gates:
+            key = DelayTable.gate_key(gate)
+            if key not in kinds:
+                kinds[key] = len(self.prototypes)
+                self.prototypes.append(prototype(gate))
+            kind.append(kinds[key])
+        self.arrays = dict((key, getattr(self.topology, key)) for key in SHARED if key != 'kind')
+        self.arrays['kind'] = np.array(kind, dtype=np.int32)
+        self.outputs = list(nodes.outputs)
+        self.results = []
+
+    def groups(self, size):
+        index = [node.index for node in self.outputs]
+        return [index[start:start + size] for start in range(0, len(index), size)]
+
+    def run(self, processes=None, group=None):
+        if group is None:
+            workers = processes if processes else os.cpu_count()
+            group = max(1, len(self.outputs) // (4 * workers))
+        groups = self.groups(group)
+        if processes == 1:
+            timing = ConeTiming(self.arrays, self.prototypes, self.vcc)
+            results = [timing.time_outputs(outputs) for outputs in groups]
+        else:
+            shared, specs = share(self.arrays)
+            try:
+                with concurrent.futures.ProcessPoolExecutor(processes, initializer=attach,
+                                                            initargs=(specs, self.prototypes, self.vcc)) as pool:
+                    results = list(pool.map(time_outputs, groups))
+            finally:
+                for block in shared:
+                    block.close()
+                    block.unlink()
+        merged = [output for outputs in results for output in outputs]
+        self.results = [(node, arrival, [self.gates[gate] for gate in path])
+                        for node, (arrival, path) in zip(self.outputs, merged)]
+        return self.results
+
+    def worst_arrivals(self):
+        return [(node, arrival) for node, arrival, path in self.results]
+
+    def print(self):
+        for node, arrival, path in self.results:
+            print(node)
+            print(path)
+            print(arrival)
+            print('')
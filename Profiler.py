@@ -0,0 +1,128 @@
+__author__ = 'Manuel'
+
+import contextlib
+import cProfile
+import io
+import json
+import pstats
+import time
+import tracemalloc
+
+import CircuitRead
+import Gates
+import Transistor
+
+# Counter name: (owner, function). While a profiler is enabled these functions are
+# replaced by counting wrappers, disabled profilers leave them untouched.
+COUNTED = {'add_node': (CircuitRead.NodeContainer, 'add_node'),
+           'get_next_nodes': (CircuitRead.NodeContainer, 'get_next_nodes'),
+           'path_delays': (CircuitRead, 'path_delays'),
+           'nand_delays': (Gates.Nand, 'calculate_delay'),
+           'calculate_cdb': (Transistor.Transistor, 'calculate_cdb')}
+
+
+class Profiler:
+    def __init__(self, enabled=True, memory=True, profile_phase=None):
+        self.enabled = False
+        self.memory = memory
+        self.profile_phase = profile_phase
+        self.phases = []
+        self.counters = dict((name, 0) for name in COUNTED)
+        self.counters['paths'] = 0
+        self.profile = None
+        self.originals = {}
+        if enabled:
+            self.enable()
+
+    def enable(self):
+        if self.enabled:
+            return
+        self.enabled = True
+        for name, (owner, attribute) in COUNTED.items():
+            self.originals[name] = getattr(owner, attribute)
+            setattr(owner, attribute, self.counting(name, self.originals[name]))
+        self.originals['calculate_paths'] = CircuitRead.NodeContainer.calculate_paths
+        CircuitRead.NodeContainer.calculate_paths = self.counting_paths(self.originals['calculate_paths'])
+        if self.memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def disable(self):
+        if not self.enabled:
+            return
+        self.enabled = False
+        for name, (owner, attribute) in COUNTED.items():
+            setattr(owner, attribute, self.originals[name])
+        CircuitRead.NodeContainer.calculate_paths = self.originals['calculate_paths']
+        self.originals = {}
+        if self.memory and tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+    def counting(self, name, function):
+        counters = self.counters
+
+        def wrapper(*args, **kwargs):
+            counters[name] += 1
+            return function(*args, **kwargs)
+        return wrapper
+
+    def counting_paths(self, function):
+        counters = self.counters
+
+        def wrapper(*args, **kwargs):
+            paths = function(*args, **kwargs)
+            counters['paths'] += sum(len(storage) for storage in paths)
+            return paths
+        return wrapper
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        if not self.enabled:
+            yield
+            return
+        if self.memory:
+            tracemalloc.reset_peak()
+        profile = None
+        if name == self.profile_phase:
+            profile = cProfile.Profile()
+            profile.enable()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            if profile:
+                profile.disable()
+                self.profile = profile
+            entry = {'name': name, 'seconds': seconds}
+            if self.memory:
+                entry['peak_memory'] = tracemalloc.get_traced_memory()[1]
+            self.phases.append(entry)
+
+    def profile_text(self, lines=25):
+        if not self.profile:
+            return ''
+        stream = io.StringIO()
+        pstats.Stats(self.profile, stream=stream).sort_stats('cumulative').print_stats(lines)
+        return stream.getvalue()
+
+    def report(self):
+        result = {'phases': self.phases, 'counters': dict(self.counters)}
+        if self.profile:
+            result['profile'] = {'phase': self.profile_phase, 'stats': self.profile_text()}
+        return result
+
+    def write_report(self, address):
+        with open(address, 'w') as out_file:
+            json.dump(self.report(), out_file, indent=2)
+
+    def print(self):
+        print('Phase'.ljust(20) + 'Seconds'.ljust(14) + 'Peak memory')
+        for entry in self.phases:
+            memory = str(entry['peak_memory']) if 'peak_memory' in entry else ''
+            print(entry['name'].ljust(20) + '{:.4f}'.format(entry['seconds']).ljust(14) + memory)
+        print('')
+        for name, count in sorted(self.counters.items()):
+            print(name.ljust(20) + str(count))
+        if self.profile:
+            print('')
+            print(self.profile_text())
@@ -0,0 +1,167 @@
+__author__ = 'Manuel'
+
+import json
+import os
+
+import numpy as np
+
+import CircuitRead
+
+# Paths kept in memory before they are written out
+CHUNK = 65536
+BUFFER_SIZE = 1 << 20
+
+# Binary columns, one file each: path delay, output node and end offset into the gate
+# column, the gate ids of every path one after the other, and the endpoint arrivals.
+COLUMNS = {'delay': 'f8', 'output': 'i4', 'offset': 'i8', 'gates': 'i4', 'endpoint': 'i4', 'arrival': 'f8'}
+
+
+def column_address(prefix, key):
+    return prefix + '.' + key
+
+
+# Streams paths and endpoint arrivals into a CSV file and into binary columns, CHUNK
+# paths at a time. Gates and nodes are numbered as they are met, their names go to
+# prefix.names.json on close.
+class ReportWriter:
+    def __init__(self, prefix, chunk=CHUNK, csv=True):
+        self.prefix = prefix
+        self.chunk = chunk
+        self.files = dict((key, open(column_address(prefix, key), 'wb', buffering=BUFFER_SIZE)) for key in COLUMNS)
+        self.buffers = dict((key, []) for key in COLUMNS)
+        self.csv = None
+        self.lines = []
+        if csv:
+            self.csv = open(prefix + '.csv', 'w', buffering=BUFFER_SIZE)
+            self.csv.write('output,delay,gates\n')
+        self.gate_index = {}
+        self.gate_names = []
+        self.node_index = {}
+        self.node_names = []
+        self.paths = 0
+        self.offset = 0
+        self.endpoints = []
+
+    def number(self, item, index, names):
+        if item not in index:
+            index[item] = len(names)
+            names.append(str(item))
+        return index[item]
+
+    def add_path(self, output, delay, path):
+        buffers = self.buffers
+        buffers['delay'].append(delay)
+        buffers['output'].append(self.number(output, self.node_index, self.node_names))
+        index = self.gate_index
+        names = self.gate_names
+        gates = [index[gate] if gate in index else self.number(gate, index, names) for gate in path]
+        buffers['gates'].extend(gates)
+        self.offset += len(gates)
+        buffers['offset'].append(self.offset)
+        if self.csv:
+            self.lines.append(str(output) + ',' + repr(delay) + ',' + ' '.join([names[gate] for gate in gates]) + '\n')
+        self.paths += 1
+        if len(buffers['delay']) >= self.chunk:
+            self.flush()
+
+    def add_endpoint(self, node, arrival):
+        self.buffers['endpoint'].append(self.number(node, self.node_index, self.node_names))
+        self.buffers['arrival'].append(arrival)
+        self.endpoints.append((str(node), arrival))
+
+    def flush(self):
+        for key, values in self.buffers.items():
+            if values:
+                np.array(values, dtype=COLUMNS[key]).tofile(self.files[key])
+                self.buffers[key] = []
+        if self.lines:
+            self.csv.writelines(self.lines)
+            self.lines = []
+
+    def close(self):
+        self.flush()
+        for out_file in self.files.values():
+            out_file.close()
+        if self.csv:
+            with open(self.prefix + '.endpoints.csv', 'w') as out_file:
+                out_file.write('node,arrival\n')
+                out_file.writelines(node + ',' + repr(arrival) + '\n' for node, arrival in self.endpoints)
+            self.csv.close()
+        with open(self.prefix + '.names.json', 'w') as out_file:
+            json.dump({'paths': self.paths, 'gates': self.gate_names, 'nodes': self.node_names}, out_file)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exception):
+        self.close()
+
+
+def read_column(prefix, key):
+    # np.memmap refuses empty files
+    address = column_address(prefix, key)
+    if not os.path.getsize(address):
+        return np.zeros(0, dtype=COLUMNS[key])
+    return np.memmap(address, dtype=COLUMNS[key], mode='r')
+
+
+# Memory mapped view of a report written by ReportWriter
+class ReportReader:
+    def __init__(self, prefix):
+        with open(prefix + '.names.json') as in_file:
+            names = json.load(in_file)
+        self.gate_names = names['gates']
+        self.node_names = names['nodes']
+        self.columns = dict((key, read_column(prefix, key)) for key in COLUMNS)
+        self.delays = self.columns['delay']
+
+    def __len__(self):
+        return len(self.delays)
+
+    def path_gates(self, i):
+        offset = self.columns['offset']
+        return self.columns['gates'][offset[i - 1] if i else 0:offset[i]]
+
+    def path(self, i):
+        return [self.gate_names[gate] for gate in self.path_gates(i)]
+
+    def output(self, i):
+        return self.node_names[self.columns['output'][i]]
+
+    def worst(self, k=10):
+        # Indices of the k worst paths, worst first
+        k = min(k, len(self))
+        if not k:
+            return []
+        index = np.argpartition(-self.delays, k - 1)[:k]
+        return index[np.argsort(-self.delays[index], kind='stable')].tolist()
+
+    def output_paths(self, name):
+        return np.flatnonzero(self.columns['output'] == self.node_names.index(name)).tolist()
+
+    def endpoints(self):
+        return [(self.node_names[node], arrival) for node, arrival in
+                zip(self.columns['endpoint'].tolist(), self.columns['arrival'].tolist())]
+
+
+def write_paths(writer, nodes, vcc, cache=None):
+    # Enumerates every input to output path straight into the writer, then the worst path
+    # delay of every output as its endpoint arrival. Gate delays are looked up once, the
+    # sums come out the same as the ones of path_delays.
+    nodes.organize()
+    if cache is None:
+        cache = CircuitRead.TimingCache()
+    delays = dict((gate, cache.delay(vcc, gate)) for gate in nodes.levelize())
+    worst = {}
+    for node in nodes.inputs:
+        for path in nodes.walk_paths(node):
+            if not path or not path[-1].outputn:
+                continue
+            output = path[-1].outputn
+            delay = sum([delays[gate] for gate in path])
+            writer.add_path(output, delay, path)
+            if delay > worst.get(output, 0):
+                worst[output] = delay
+    for node in nodes.outputs:
+        if node in worst:
+            writer.add_endpoint(node, worst[node])
@@ -0,0 +1,152 @@
+__author__ = 'Manuel'
+
+import numpy as np
+
+import Topology
+
+WORD = 64
+ALL_ONES = np.uint64(0xFFFFFFFFFFFFFFFF)
+# Bytes of node values run keeps at a time, which sets how many words it simulates at once
+CHUNK_BYTES = 1 << 27
+
+# Logic function of every gate type over packed words, b is a again for single input gates
+OPERATIONS = {'nand': lambda a, b: ~(a & b),
+              'inv': lambda a, b: ~a,
+              'and': np.bitwise_and,
+              'or': np.bitwise_or,
+              'xor': np.bitwise_xor}
+
+# Set bits of every byte value, for numpy versions without bitwise_count
+BYTE_COUNTS = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+
+def popcount(words):
+    if hasattr(np, 'bitwise_count'):
+        return np.bitwise_count(words)
+    counts = BYTE_COUNTS[words.view(np.uint8)]
+    return counts.reshape(words.shape + (8,)).sum(axis=-1)
+
+
+def pack(vectors):
+    # (vectors, inputs) array of 0/1 into (inputs, words) uint64 words, vector i in bit i % 64
+    vectors = np.asarray(vectors, dtype=bool)
+    padding = -len(vectors) % WORD
+    if padding:
+        vectors = np.concatenate((vectors, np.zeros((padding, vectors.shape[1]), dtype=bool)))
+    packed = np.packbits(vectors.T, axis=1, bitorder='little')
+    return np.ascontiguousarray(packed).view('<u8').astype(np.uint64)
+
+
+# Zero delay logic simulation, 64 vectors per word, one level of gates at a time. Counts
+# how often every node is 1 and how often it changes between consecutive vectors, which
+# gives toggle rates and, with the node loads, the dynamic power.
+class LogicSimulator:
+    def __init__(self, nodes, vcc=None):
+        nodes.organize()
+        self.nodes = nodes
+        self.vcc = vcc
+        self.gates = nodes.levelize()
+        self.topology = Topology.Topology.from_nodes(nodes, self.gates)
+        topology = self.topology
+        self.inputs = topology.inputs()
+        self.input_names = [topology.node_names[node] for node in self.inputs]
+
+        # One step per gate type of every level
+        self.steps = []
+        for level in topology.levelize():
+            types = topology.gate_type[level]
+            for code in np.unique(types):
+                gates = level[types == code]
+                operation = OPERATIONS[Topology.TYPE_NAMES[code]]
+                self.steps.append((operation, topology.out[gates], topology.a[gates], topology.b[gates]))
+
+        # Switched capacitance of every node, the same load the timing uses
+        self.load = topology.node_loads(np.array([gate.calculate_gc() for gate in self.gates], dtype=float))
+        self.reset()
+
+    def reset(self):
+        self.vectors = 0
+        self.ones = np.zeros(len(self.topology), dtype=np.int64)
+        self.toggles = np.zeros(len(self.topology), dtype=np.int64)
+        self.last = None
+
+    def evaluate(self, words):
+        # Values of every node for (inputs, words) input words
+        values = np.zeros((len(self.topology), words.shape[1]), dtype=np.uint64)
+        values[self.inputs] = words
+        for operation, out, a, b in self.steps:
+            values[out] = operation(values[a], values[b])
+        return values
+
+    def simulate(self, words, count=None):
+        # Adds count vectors (every bit of words by default) to the statistics. Vectors
+        # continue the sequence of the previous call, so only the last call may be partial.
+        count = count if count is not None else WORD * words.shape[1]
+        if not count:
+            return
+        words = words[:, :(count + WORD - 1) // WORD]
+        values = self.evaluate(words)
+        mask = np.full(words.shape[1], ALL_ONES)
+        if count % WORD:
+            mask[-1] = np.uint64((1 << (count % WORD)) - 1)
+
+        # Bit i of previous is the value of the vector before vector i
+        previous = values << np.uint64(1)
+        previous[:, 1:] |= values[:, :-1] >> np.uint64(WORD - 1)
+        previous[:, 0] |= self.last if self.last is not None else values[:, 0] & np.uint64(1)
+
+        self.ones += popcount(values & mask).sum(axis=1, dtype=np.int64)
+        self.toggles += popcount((values ^ previous) & mask).sum(axis=1, dtype=np.int64)
+        self.last = (values[:, -1] >> np.uint64((count - 1) % WORD)) & np.uint64(1)
+        self.vectors += count
+
+    def run(self, vectors, seed=0, probability=None, chunk=None):
+        # Simulates random input vectors, each input is 1 with the given probability (0.5 by
+        # default). chunk is in words of 64 vectors.
+        if chunk is None:
+            chunk = max(1, CHUNK_BYTES // (8 * len(self.topology)))
+        rng = np.random.default_rng(seed)
+        done = 0
+        while done < vectors:
+            count = min(chunk * WORD, vectors - done)
+            words = (count + WORD - 1) // WORD
+            if probability is None:
+                block = rng.integers(0, ALL_ONES, (len(self.inputs), words), dtype=np.uint64, endpoint=True)
+            else:
+                bits = rng.random((words * WORD, len(self.inputs))) < probability
+                block = pack(bits)
+            self.simulate(block, count)
+            done += count
+
+    def run_vectors(self, vectors):
+        # User vectors as a (vectors, inputs) 0/1 array, columns in input_names order
+        vectors = np.asarray(vectors)
+        self.simulate(pack(vectors), len(vectors))
+
+    def toggle_rates(self):
+        # Changes per vector transition of every node
+        return self.toggles / max(self.vectors - 1, 1)
+
+    def probabilities(self):
+        return self.ones / max(self.vectors, 1)
+
+    def power(self, frequency, vcc=None):
+        # Dynamic power of every node, 1/2 C V^2 for every change at frequency vectors per second
+        vcc = vcc if vcc is not None else self.vcc
+        return 0.5 * self.load * vcc * vcc * frequency * self.toggle_rates()
+
+    def report(self, frequency, vcc=None):
+        power = self.power(frequency, vcc)
+        return {'vectors': self.vectors,
+                'total_power': power.sum(),
+                'nodes': dict((self.topology.node_names[i], (rate, probability, p)) for i, (rate, probability, p) in
+                              enumerate(zip(self.toggle_rates(), self.probabilities(), power)))}
+
+    def print_report(self, frequency, vcc=None):
+        result = self.report(frequency, vcc)
+        print('Vectors = ' + str(result['vectors']))
+        print('Node'.ljust(14) + 'Toggle rate'.ljust(14) + 'P(1)'.ljust(14) + 'Power')
+        for name, (rate, probability, power) in result['nodes'].items():
+            print(name.ljust(14) + '{:.4f}'.format(rate).ljust(14) + '{:.4f}'.format(probability).ljust(14) +
+                  '{:.4E}'.format(power))
+        print('Total power = {:.4E}'.format(result['total_power']))
@@ -0,0 +1,216 @@
+__author__ = 'Manuel'
+
+# Widths are kept on this grid, so resized gates keep sharing their NandSizing objects
+GRID = 0.1
+# Largest upsizing factor of one step, and the smallest one worth trying
+MAX_STEP = 2.0
+MIN_STEP = 1.1
+# Downsizing factor tried while giving width back
+DOWN_STEP = 0.8
+# Gates of the critical path upsized together, when their gain per width is within
+# BATCH_GAIN of the best one, and gates downsized together at first
+UPSIZE_BATCH = 8
+BATCH_GAIN = 0.5
+RECOVER_BATCH = 64
+ITERATIONS = 10000
+# Without a maximum, a gate grows to at most MAX_GROWTH times its starting size
+MAX_GROWTH = 8
+# Upsizing stops when STALL_STEPS steps gained less worst slack than STALL_GAIN times the
+# largest required time
+STALL_STEPS = 50
+STALL_GAIN = 1e-4
+
+
+def gate_size(gate):
+    # (wp, wn) of a gate, resize sets every nand of a gate to the same sizes
+    sizing = gate.stages()[0][0].sizing
+    return sizing.tp.w, sizing.tn.w
+
+
+def snap(width):
+    return round(round(width / GRID) * GRID, 6)
+
+
+# Sizes gates until every constrained node meets its required time, then gives width
+# back where there is slack. Every step resizes a batch of gates through
+# TimingAnalysis.resize_gates, which only retimes the fan-out cone that changes, so a
+# step costs about as much as the gates it slows down or speeds up.
+class GateSizer:
+    def __init__(self, analysis, period=None, required=None, minimum=None, maximum=None):
+        self.analysis = analysis
+        self.cache = analysis.cache
+        self.vcc = analysis.vcc
+        if not analysis.order:
+            analysis.propagate()
+        analysis.constrain(period, required)
+        self.gates = list(analysis.order)
+        # Sizes are kept between minimum and maximum (wp, wn), by default a gate never
+        # goes below the size it started with or above MAX_GROWTH times it
+        self.start = dict((gate, gate_size(gate)) for gate in self.gates)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.nands = {}
+        self.start_width = self.total_width()
+        self.steps = 0
+        # Upsizing candidates as gate: (driver, gain per width, size), dropped when the gate,
+        # its drivers or its fan-out are resized
+        self.candidates = {}
+
+    def lower(self, gate):
+        return self.minimum if self.minimum else self.start[gate]
+
+    def upper(self, gate):
+        return self.maximum if self.maximum else tuple(MAX_GROWTH * w for w in self.start[gate])
+
+    def nand_count(self, gate):
+        if type(gate) not in self.nands:
+            self.nands[type(gate)] = len(gate.transistors()) // 4
+        return self.nands[type(gate)]
+
+    def width(self, gate, size=None):
+        # Total transistor width, every nand has two p and two n transistors
+        wp, wn = size if size else gate_size(gate)
+        return 2 * self.nand_count(gate) * (wp + wn)
+
+    def total_width(self):
+        return sum(self.width(gate) for gate in self.gates)
+
+    def proposal(self, gate, ratio):
+        # Sizes the inverter equivalent equations ask for to speed the output stage of gate
+        # up by ratio, kept within one step and the maximum size
+        nand = gate.stages()[-1][0]
+        load = self.cache.load(gate)
+        delay = nand.calculate_delay(self.vcc, load) * ratio
+        wn = 2 * nand.sizing.tn.l * nand.calculate_wln_inverter_eq(
+            self.vcc, load + nand.calculate_int_loac_c(self.vcc, self.vcc * 0.5), delay)
+        wp = nand.sizing.tp.l * nand.calculate_wlp_inverter_eq(
+            self.vcc, load + nand.calculate_int_loac_c(0, self.vcc * 0.5), delay)
+        size = []
+        for i, (old, new) in enumerate(zip(gate_size(gate), (wp, wn))):
+            new = min(max(new, old * MIN_STEP), old * MAX_STEP, self.upper(gate)[i])
+            size.append(max(snap(new), old))
+        size = tuple(size)
+        if size == gate_size(gate):
+            return None
+        return size
+
+    def trial(self, gate, size, gates):
+        # Change of the summed delay of gates with gate resized to size, tried on the cache alone
+        old = gate_size(gate)
+        before = sum([self.analysis.delays[g] for g in gates])
+        self.cache.resize(gate, *size)
+        after = sum([self.cache.delay(self.vcc, g) for g in gates])
+        self.cache.resize(gate, *old)
+        return after - before
+
+    def candidate(self, gate, driver, ratio):
+        # (driver, gain per added width, size) of upsizing gate on a path through driver, the
+        # proposal keeps the ratio of the step that first made it
+        if gate not in self.candidates or self.candidates[gate][0] is not driver:
+            size = self.proposal(gate, ratio)
+            gain = 0
+            if size:
+                gain = -self.trial(gate, size, [gate, driver] if driver else [gate])
+                gain /= self.width(gate, size) - self.width(gate)
+            self.candidates[gate] = (driver, gain, size)
+        return self.candidates[gate]
+
+    def resize(self, sizes):
+        # The delays of the gates and their drivers change, and with them every candidate
+        # that tried one of them
+        for gate in sizes:
+            for driver in self.analysis.drivers(gate) + [gate]:
+                self.candidates.pop(driver, None)
+                for neighbour in driver.outputn.inputs:
+                    self.candidates.pop(neighbour, None)
+        self.analysis.resize_gates(sizes)
+        self.steps += 1
+
+    def upsize(self):
+        # One step on the critical path of the worst failing endpoint, the gates with the
+        # largest delay gain per added width are resized. False once timing is met or no
+        # gate on the path can help.
+        failing = self.analysis.failing_endpoints()
+        if not failing:
+            return False
+        slack, node = failing[0]
+        ratio = self.analysis.constraints[node] / self.analysis.get_arrival(node)
+        candidates = []
+        driver = None
+        for gate in self.analysis.critical_path(node):
+            gain, size = self.candidate(gate, driver, ratio)[1:]
+            if gain > 0:
+                candidates.append((gain, gate, size))
+            driver = gate
+        if not candidates:
+            return False
+        candidates.sort(key=lambda candidate: -candidate[0])
+        best = candidates[0][0]
+        self.resize(dict((gate, size) for gain, gate, size in candidates[:UPSIZE_BATCH] if gain >= best * BATCH_GAIN))
+        return True
+
+    def recover(self, iterations):
+        # One pass over the gates above their lower size, most slack first. Downsizing only
+        # slows the gate itself, so a gate whose extra delay fits in the slack of its output
+        # is downsized, RECOVER_BATCH gates at a time. Gates of a batch can share paths, a
+        # batch that makes an endpoint fail is put back and retried in halves.
+        analysis = self.analysis
+        analysis.propagate_required()
+        candidates = []
+        for gate in self.gates:
+            slack = analysis.get_slack(gate.outputn) if gate.outputn else 0
+            if slack > 0 and gate_size(gate) != self.lower(gate):
+                candidates.append((slack, gate))
+        candidates.sort(key=lambda candidate: -candidate[0])
+        changed = False
+        batch = RECOVER_BATCH
+        i = 0
+        while i < len(candidates) and self.steps < iterations:
+            old = {}
+            sizes = {}
+            for slack, gate in candidates[i:i + batch]:
+                size = tuple(min(max(snap(w * DOWN_STEP), low), w) for w, low in zip(gate_size(gate), self.lower(gate)))
+                if size != gate_size(gate) and self.trial(gate, size, [gate]) < slack:
+                    old[gate] = gate_size(gate)
+                    sizes[gate] = size
+            if sizes:
+                self.resize(sizes)
+                if analysis.failing_endpoints():
+                    self.resize(old)
+                    if batch > 1:
+                        batch //= 2
+                        continue
+                else:
+                    changed = True
+            i += batch
+        return changed
+
+    def run(self, iterations=ITERATIONS):
+        # Returns whether timing is met, iterations bounds the resize steps of both phases.
+        # When upsizing cannot meet timing every gate goes back to its starting size.
+        stall = STALL_GAIN * max(list(self.analysis.constraints.values()) + [0])
+        history = [self.worst_slack()]
+        while self.steps < iterations and self.upsize():
+            history.append(self.worst_slack())
+            if len(history) > STALL_STEPS and history[-1] - history[-1 - STALL_STEPS] < stall:
+                break
+        if self.analysis.failing_endpoints():
+            self.restore()
+            return False
+        while self.steps < iterations and self.recover(iterations):
+            pass
+        return True
+
+    def restore(self):
+        sizes = dict((gate, size) for gate, size in self.start.items() if gate_size(gate) != size)
+        if sizes:
+            self.resize(sizes)
+
+    def worst_slack(self):
+        arrival = self.analysis.arrival
+        return min([time - arrival[node.index] for node, time in self.analysis.constraints.items()] + [float('inf')])
+
+    def print(self):
+        print('Steps = ' + str(self.steps))
+        print('Worst slack = {:.4E}'.format(self.worst_slack()))
+        print('Total width = {:.4E} -> {:.4E}'.format(self.start_width, self.total_width()))
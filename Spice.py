@@ -0,0 +1,37 @@
+__author__ = 'Manuel'
+
+import Gates
+
+BUFFER_SIZE = 1 << 20
+BATCH_SIZE = 4096
+
+
+def write_deck(address, gates, vcc=None, title='DCA circuit'):
+    # Writes a complete SPICE deck: the transistors of every gate, then one .MODEL card
+    # per model and .END. Instance lines are joined and written BATCH_SIZE at a time.
+    models = {}
+    with open(address, 'w', buffering=BUFFER_SIZE) as out_file:
+        out_file.write('* ' + title + '\n')
+        if vcc is not None:
+            out_file.write('VDD ' + Gates.VCC + ' 0 DC ' + str(vcc) + '\n')
+            out_file.write('VSS ' + Gates.GND + ' 0 DC 0\n')
+
+        batch = []
+        for gate in gates:
+            for transistor in gate.transistors():
+                card = transistor.card
+                if card.model not in models:
+                    models[card.model] = card
+                elif models[card.model] is not card and models[card.model].parameters != card.parameters:
+                    raise ValueError('Model ' + card.model + ' is used with two different parameter sets')
+                batch.append(transistor.spice_instance())
+            if len(batch) >= BATCH_SIZE:
+                batch.append('')
+                out_file.write('\n'.join(batch))
+                batch = []
+        batch.append('')
+        out_file.write('\n'.join(batch))
+
+        for model in models.values():
+            out_file.write(model.spice_model() + '\n')
+        out_file.write('.END\n')
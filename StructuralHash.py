@@ -0,0 +1,68 @@
+__author__ = 'Manuel'
+
+import CircuitRead
+
+
+def gate_kind(gate):
+    # Like DelayTable.gate_key, but on the shared NandSizing objects, which is cheaper
+    return (type(gate),) + tuple(n.sizing for nand, loads, factor in gate.stages() for n in [nand] + loads)
+
+
+# Numbers the fan-in cones of a levelized netlist by structure. Two gates get the same
+# delay class when they are of the same kind (gate_kind) and drive the same load, and
+# two nodes get the same cone class when their drivers have the same delay class and
+# their inputs the same cone classes. Primary inputs all arrive at 0 and are cone class
+# 0. Nodes of a class share one arrival time, gates of a class one delay.
+class StructuralHash:
+    def __init__(self, nodes):
+        nodes.organize()
+        self.nodes = nodes
+        self.order = nodes.levelize()
+        delay_classes = {}
+        cone_classes = {(): 0}
+        # Representative gate and input cone classes of every class
+        self.delay_gates = []
+        self.cone_inputs = [()]
+        self.cone_delay = [None]
+        self.gate_class = {}
+        self.node_class = [0] * len(nodes)
+        for gate in self.order:
+            key = (gate_kind(gate), CircuitRead.gate_load(gate))
+            if key not in delay_classes:
+                delay_classes[key] = len(self.delay_gates)
+                self.delay_gates.append(gate)
+            delay_class = delay_classes[key]
+            self.gate_class[gate] = delay_class
+
+            # Every gate type times its inputs with max, so their order does not matter
+            inputs = tuple(sorted(set(self.node_class[node.index] for node in gate.pins())))
+            key = (delay_class, inputs)
+            if key not in cone_classes:
+                cone_classes[key] = len(self.cone_inputs)
+                self.cone_inputs.append(inputs)
+                self.cone_delay.append(delay_class)
+            self.node_class[gate.outputn.index] = cone_classes[key]
+
+    def delay_ratio(self):
+        return len(self.order) / max(len(self.delay_gates), 1)
+
+    def cone_ratio(self):
+        return len(self.order) / max(len(self.cone_inputs) - 1, 1)
+
+    def delays(self, vcc, cache=None):
+        # Delay of every delay class, timed on its representative gate
+        if cache:
+            return [cache.delay(vcc, gate) for gate in self.delay_gates]
+        return [CircuitRead.gate_delay(vcc, gate) for gate in self.delay_gates]
+
+    def arrivals(self, delays):
+        # Arrival time of every cone class, classes are numbered in topological order
+        arrival = [0]
+        for inputs, delay_class in zip(self.cone_inputs[1:], self.cone_delay[1:]):
+            arrival.append(max(arrival[i] for i in inputs) + delays[delay_class])
+        return arrival
+
+    def print(self):
+        print('Gates = ' + str(len(self.order)))
+        print('Delay classes = ' + str(len(self.delay_gates)) + ', ratio = {:.2f}'.format(self.delay_ratio()))
+        print('Cone classes = ' + str(len(self.cone_inputs) - 1) + ', ratio = {:.2f}'.format(self.cone_ratio()))
@@ -0,0 +1,291 @@
+__author__ = 'Manuel'
+
+import heapq
+import itertools
+
+import CircuitRead
+import StructuralHash
+
+
+# Block based timing: every gate is evaluated once, in topological order,
+# instead of once per input to output path.
+class TimingAnalysis:
+    def __init__(self, nodes, vcc, cache=None):
+        self.nodes = nodes
+        self.vcc = vcc
+        self.cache = cache if cache else CircuitRead.TimingCache()
+        self.order = []
+        self.delays = {}
+        # Indexed by Node.index
+        self.arrival = []
+        self.level = []
+        self.hashing = None
+        # Required time of every constrained node, and of every node after propagate_required
+        self.constraints = {}
+        self.required = []
+
+    def propagate(self, structural=False):
+        self.nodes.organize()
+        self.order = self.nodes.levelize()
+        if structural:
+            self.propagate_structural()
+            return
+        self.delays = {}
+        self.arrival = [0] * len(self.nodes)
+        self.level = [0] * len(self.nodes)
+        for gate in self.order:
+            self.delays[gate] = self.cache.delay(self.vcc, gate)
+            self.arrival[gate.outputn.index] = self.input_arrival(gate) + self.delays[gate]
+            self.level[gate.outputn.index] = self.input_level(gate) + 1
+
+    def propagate_structural(self):
+        # Same results as propagate, with every delay and arrival computed once per
+        # StructuralHash class
+        self.hashing = StructuralHash.StructuralHash(self.nodes)
+        delays = self.hashing.delays(self.vcc, self.cache)
+        arrival = self.hashing.arrivals(delays)
+        self.delays = dict((gate, delays[c]) for gate, c in self.hashing.gate_class.items())
+        self.arrival = [arrival[c] for c in self.hashing.node_class]
+        self.level = list(self.nodes.level)
+
+    def retime(self, gates, seeds=()):
+        # Recomputes the delays of gates, then the arrival times of their outputs and of the
+        # seed nodes, following the fan-out cone level by level until arrivals stop changing.
+        # A gate is always above its inputs, so a level is complete once it is reached.
+        arrivals = self.arrival
+        levels = self.level
+        delays = self.delays
+        buckets = {}
+        queued = set()
+        for gate in gates:
+            delays[gate] = self.cache.delay(self.vcc, gate)
+        for node in [gate.outputn for gate in gates] + list(seeds):
+            if node.index not in queued:
+                queued.add(node.index)
+                buckets.setdefault(levels[node.index], []).append(node)
+        level = min(buckets) if buckets else 0
+        while buckets:
+            nodes = buckets.pop(level, None)
+            level += 1
+            if not nodes:
+                continue
+            for node in nodes:
+                gate = node.output
+                arrival = max(arrivals[gate.an.index], arrivals[gate.bn.index]) + delays[gate] if gate else 0
+                if arrival == arrivals[node.index]:
+                    continue
+                arrivals[node.index] = arrival
+                for gate in node.inputs:
+                    out = gate.outputn
+                    if out.index not in queued:
+                        queued.add(out.index)
+                        buckets.setdefault(levels[out.index], []).append(out)
+
+    def relevel(self, node):
+        # Raises the levels in the fan-out cone of node until every gate is above its inputs
+        stack = [node]
+        while stack:
+            for gate in stack.pop().inputs:
+                level = self.input_level(gate) + 1
+                if level > self.level[gate.outputn.index]:
+                    if level > len(self.level):
+                        raise ValueError('Combinational loop through gate ' + gate.id)
+                    self.level[gate.outputn.index] = level
+                    stack.append(gate.outputn)
+
+    def drivers(self, gate):
+        return [node.output for node in set_inputs(gate) if node.output]
+
+    def set_capacitance(self, node, capacitance):
+        self.cache.set_capacitance(node, capacitance)
+        if node.output:
+            self.retime([node.output])
+
+    def resize_gate(self, gate, wp, wn):
+        self.cache.resize(gate, wp, wn)
+        self.retime([gate] + self.drivers(gate))
+
+    def resize_gates(self, sizes):
+        # Several resizes, gate: (wp, wn), with a single retime of their joint fan-out cone
+        gates = set()
+        for gate, (wp, wn) in sizes.items():
+            self.cache.resize(gate, wp, wn)
+            gates.add(gate)
+            gates.update(self.drivers(gate))
+        self.retime(list(gates))
+
+    def replace_gate(self, gate, new_gate, a=None, b=None):
+        a = a if a else gate.an
+        b = b if b else gate.bn
+        out = gate.outputn
+        self.remove_gate(gate)
+        self.add_gate(new_gate, a, b, out)
+
+    def add_gate(self, gate, a, b, out):
+        if out.output:
+            raise ValueError('Node ' + out.name + ' is already driven by gate ' + out.output.id)
+        # Nodes added since the last edit are new to the inputs and outputs lists as well
+        count = len(self.arrival)
+        ends = self.nodes.ends([a, b, out] + self.nodes.nodes[count:], count)
+        self.nodes.connect(gate, a, b, out)
+        self.nodes.reorganize(ends)
+        grow = len(self.nodes) - len(self.arrival)
+        self.arrival.extend([0] * grow)
+        self.level.extend([0] * grow)
+        for node in set_inputs(gate):
+            self.cache.invalidate_node(node)
+        self.level[out.index] = max(self.level[out.index], self.input_level(gate) + 1)
+        self.relevel(out)
+        self.retime([gate] + self.drivers(gate))
+
+    def remove_gate(self, gate):
+        out = gate.outputn
+        ends = self.nodes.ends(gate.pins() + ([out] if out else []), len(self.arrival))
+        self.nodes.disconnect(gate)
+        self.nodes.reorganize(ends)
+        self.cache.invalidate_load(gate)
+        self.delays.pop(gate, None)
+        for node in set_inputs(gate):
+            self.cache.invalidate_node(node)
+        self.retime(self.drivers(gate), [out])
+
+    def get_arrival(self, node):
+        return self.arrival[node.index]
+
+    def input_arrival(self, gate):
+        return max(self.arrival[gate.an.index], self.arrival[gate.bn.index])
+
+    def input_level(self, gate):
+        return max(self.level[gate.an.index], self.level[gate.bn.index])
+
+    def worst_input(self, gate):
+        if self.arrival[gate.bn.index] > self.arrival[gate.an.index]:
+            return gate.bn
+        return gate.an
+
+    def critical_path(self, node):
+        path = []
+        gate = node.output
+        while gate:
+            path.append(gate)
+            gate = self.worst_input(gate).output
+        path.reverse()
+        return path
+
+    def worst_paths(self, node, k=None, threshold=None):
+        # Best first search from the output back towards the inputs. A partial path is
+        # ranked by the arrival time at its head plus the delay of its tail, which is the
+        # delay of the worst complete path it can still become, so paths come out in
+        # delay order and only the ones asked for are ever built.
+        counter = itertools.count()
+        heap = [(-self.arrival[node.index], next(counter), 0, node, None)]
+        found = 0
+        while heap and (k is None or found < k):
+            key, _, tail_delay, head, tail = heapq.heappop(heap)
+            if threshold is not None and -key < threshold:
+                return
+            gate = head.output
+            if not gate:
+                path = []
+                while tail:
+                    path.append(tail[0])
+                    tail = tail[1]
+                found += 1
+                yield self.path_delay(path), path
+                continue
+            tail = (gate, tail)
+            tail_delay += self.delays[gate]
+            for n in set_inputs(gate):
+                heapq.heappush(heap, (-(self.arrival[n.index] + tail_delay), next(counter), tail_delay, n, tail))
+
+    def path_delay(self, path):
+        total_delay = 0
+        for gate in path:
+            total_delay += self.delays[gate]
+        return total_delay
+
+    def constrain(self, period=None, required=None):
+        # Every output has to arrive within the clock period, required maps node names to
+        # their own required times and overrides it
+        self.constraints = {}
+        if period is not None:
+            for node in self.nodes.outputs:
+                self.constraints[node] = period
+        for name, time in (required if required else {}).items():
+            self.constraints[self.nodes.get_node(name)] = time
+
+    def propagate_required(self):
+        # Backward sweep in reverse topological order, a node has to arrive by the earliest
+        # required time of its fan-out gates minus their delays. Unconstrained nodes never fail.
+        self.required = [float('inf')] * len(self.nodes)
+        for node, time in self.constraints.items():
+            self.required[node.index] = time
+        for gate in reversed(self.nodes.levelize()):
+            if not gate.outputn:
+                continue
+            required = self.required[gate.outputn.index] - self.delays[gate]
+            for node in set_inputs(gate):
+                if required < self.required[node.index]:
+                    self.required[node.index] = required
+
+    def get_slack(self, node):
+        return self.required[node.index] - self.arrival[node.index]
+
+    def failing_endpoints(self):
+        # (slack, node) of every constrained node that arrives late, worst first
+        failing = [(time - self.arrival[node.index], node) for node, time in self.constraints.items()
+                   if self.arrival[node.index] > time]
+        failing.sort(key=lambda endpoint: endpoint[0])
+        return failing
+
+    def violations(self):
+        # Failing endpoints and the nodes of their negative slack fan-in cones. The endpoints
+        # are checked first, so a design that meets timing needs no backward sweep, and the
+        # cones are walked from the failing endpoints only, never through a node with slack.
+        failing = self.failing_endpoints()
+        if not failing:
+            return [], []
+        self.propagate_required()
+        cone = []
+        seen = set()
+        stack = [node for slack, node in failing]
+        while stack:
+            node = stack.pop()
+            if node.index in seen:
+                continue
+            seen.add(node.index)
+            cone.append(node)
+            if node.output:
+                stack.extend(n for n in set_inputs(node.output) if self.get_slack(n) < 0)
+        return failing, cone
+
+    def print_violations(self):
+        failing, cone = self.violations()
+        if not failing:
+            print('No timing violations')
+            return
+        for slack, node in failing:
+            print(node)
+            print(self.critical_path(node))
+            print('Arrival = {:.4E}, required = {:.4E}, slack = {:.4E}'.format(
+                self.arrival[node.index], self.constraints[node], slack))
+            print('')
+        print('Negative slack nodes = ' + str(len(cone)))
+        for node in cone:
+            print(node.name.ljust(14) + '{:.4E}'.format(self.get_slack(node)))
+
+    def worst_arrivals(self):
+        return [(node, self.arrival[node.index]) for node in self.nodes.outputs]
+
+    def print(self):
+        for node, arrival in self.worst_arrivals():
+            print(node)
+            print(self.critical_path(node))
+            print(arrival)
+            print('')
+
+
+def set_inputs(gate):
+    if gate.an is gate.bn:
+        return gate.an,
+    return gate.an, gate.bn
@@ -0,0 +1,170 @@
+__author__ = 'Manuel'
+
+import argparse
+import asyncio
+import json
+import math
+import socket
+import sys
+
+import CircuitRead
+import Sizing
+import Spice
+import Timing
+import Transistor
+
+tp = Transistor.Transistor(None, "PM1", None, 18.6, 1.2, transistor_type='P', nsub=1e15, lens=3.5, lend=3.9,
+                           nsubsw=2.1e16, nds=1e20, tox=60, xj=0.8, vto=-1.0, ld=0.25, uo=1000, cox=6, level=3)
+tn = Transistor.Transistor(None, "NM1", None, 4.7, 1.2, transistor_type='N', nsub=1e15, lens=3.5, lend=3.9,
+                           nsubsw=2.1e16, nds=1e20, tox=60, xj=0.8, vto=0.8, ld=0.25, uo=1000, cox=12, level=3)
+
+# Paths returned by a paths request that does not give k
+PATHS = 10
+
+
+def read_value(value):
+    if isinstance(value, str):
+        return CircuitRead.parse_value(value)
+    return float(value)
+
+
+def read_width(request, key):
+    width = read_value(request[key])
+    if not math.isfinite(width) or width <= 0:
+        raise ValueError(key + ' has to be a positive width, not ' + str(request[key]))
+    return width
+
+
+# Keeps one netlist and its block based timing in memory and answers JSON requests.
+# Edits retime incrementally, so the timing cache stays warm between requests. A
+# request with "what_if": true is undone once its answer is built.
+class TimingServer:
+    def __init__(self, address, tp, tn, cache_dir=None):
+        self.address = address
+        self.nodes = CircuitRead.NodeContainer()
+        self.vcc, self.gates = CircuitRead.read_circuit(address, tp, tn, self.nodes, cache_dir)
+        self.gate_names = dict((gate.id, gate) for gate in self.gates)
+        self.analysis = Timing.TimingAnalysis(self.nodes, self.vcc)
+        self.analysis.propagate()
+        self.requests = 0
+        self.handlers = {'worst': self.worst,
+                         'paths': self.paths,
+                         'capacitance': self.capacitance,
+                         'resize': self.resize,
+                         'spice': self.spice,
+                         'stats': self.stats}
+
+    def node(self, request):
+        return self.nodes.get_node(request['node'])
+
+    def gate(self, request):
+        return self.gate_names[request['gate']]
+
+    def worst(self, request):
+        if 'node' in request:
+            node = self.node(request)
+            return {'node': node.name, 'arrival': self.analysis.get_arrival(node),
+                    'path': [gate.id for gate in self.analysis.critical_path(node)]}
+        arrivals = self.analysis.worst_arrivals()
+        worst = max(arrivals, key=lambda arrival: arrival[1]) if arrivals else (None, 0)
+        return {'worst': {'node': str(worst[0]), 'arrival': worst[1]},
+                'outputs': dict((node.name, arrival) for node, arrival in arrivals)}
+
+    def paths(self, request):
+        node = self.node(request)
+        paths = self.analysis.worst_paths(node, request.get('k', PATHS), request.get('threshold'))
+        return {'node': node.name, 'paths': [{'delay': delay, 'gates': [gate.id for gate in path]}
+                                             for delay, path in paths]}
+
+    def capacitance(self, request):
+        node = self.node(request)
+        old = node.capacitance
+        self.analysis.set_capacitance(node, read_value(request['value']))
+        return self.edited(request, lambda: self.analysis.set_capacitance(node, old))
+
+    def resize(self, request):
+        gate = self.gate(request)
+        wp = read_width(request, 'wp')
+        wn = read_width(request, 'wn')
+        old = Sizing.gate_size(gate)
+        try:
+            self.analysis.resize_gate(gate, wp, wn)
+        except ArithmeticError:
+            # Sizes the delay equations cannot take, the gate goes back to its old size
+            self.analysis.resize_gate(gate, *old)
+            raise
+        return self.edited(request, lambda: self.analysis.resize_gate(gate, *old))
+
+    def edited(self, request, undo):
+        answer = self.worst({})
+        if request.get('what_if'):
+            undo()
+        return answer
+
+    def spice(self, request):
+        address = request.get('address', self.address + '.cir')
+        Spice.write_deck(address, self.gates, self.vcc)
+        return {'address': address}
+
+    def stats(self, request):
+        cache = self.analysis.cache
+        return {'gates': len(self.gates), 'nodes': len(self.nodes), 'requests': self.requests,
+                'hits': cache.hits, 'misses': cache.misses}
+
+    def answer(self, line):
+        self.requests += 1
+        try:
+            request = json.loads(line)
+            answer = self.handlers[request['op']](request)
+        except KeyError as error:
+            answer = {'error': 'Unknown ' + str(error)}
+        except (TypeError, ValueError, ArithmeticError) as error:
+            answer = {'error': str(error)}
+        return json.dumps(answer) + '\n'
+
+    async def client(self, reader, writer):
+        # One JSON request per line, one JSON answer per line. Requests are answered on the
+        # event loop thread, so edits from different clients never interleave.
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                writer.write(self.answer(line).encode())
+                await writer.drain()
+        finally:
+            writer.close()
+
+    async def serve(self, path):
+        server = await asyncio.start_unix_server(self.client, path)
+        async with server:
+            await server.serve_forever()
+
+
+def request(path, message):
+    # Blocking one shot client, for scripts
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+        client.connect(path)
+        client.sendall((json.dumps(message) + '\n').encode())
+        stream = client.makefile('r')
+        return json.loads(stream.readline())
+
+
+def main(arguments):
+    parser = argparse.ArgumentParser(description='Serves timing queries on a netlist over a Unix socket.')
+    parser.add_argument('netlist')
+    parser.add_argument('socket')
+    parser.add_argument('--cache-dir', help='directory for parsed netlist snapshots')
+    arguments = parser.parse_args(arguments)
+
+    server = TimingServer(arguments.netlist, tp, tn, arguments.cache_dir)
+    print('Serving ' + arguments.netlist + ' on ' + arguments.socket, file=sys.stderr)
+    try:
+        asyncio.run(server.serve(arguments.socket))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
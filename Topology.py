@@ -0,0 +1,216 @@
+__author__ = 'Manuel'
+
+import numpy as np
+
+import CircuitRead
+
+# Gate type codes, in CircuitRead.GATE_TYPES order
+TYPE_NAMES = list(CircuitRead.GATE_TYPES)
+TYPE_CODES = dict((name, code) for code, name in enumerate(TYPE_NAMES))
+CLASS_CODES = dict((CircuitRead.GATE_TYPES[name][0], code) for code, name in enumerate(TYPE_NAMES))
+
+
+# Strings kept as one joined string and an offsets array instead of a list of objects
+class NameTable:
+    def __init__(self, names):
+        self.text = ''.join(names)
+        self.offsets = np.cumsum([0] + [len(name) for name in names], dtype=np.int64)
+        self.lookup = None
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        return self.text[self.offsets[i]:self.offsets[i + 1]]
+
+    def index(self, name):
+        if self.lookup is None:
+            self.lookup = dict((self[i], i) for i in range(len(self)))
+        return self.lookup[name]
+
+    def nbytes(self):
+        return len(self.text) + self.offsets.nbytes
+
+
+def csr(rows, values, size, order=None):
+    # Offsets and values of a compressed sparse row table, keeping the value order within a
+    # row unless another sorting order is given
+    if order is None:
+        order = np.argsort(rows, kind='stable')
+    offsets = np.zeros(size + 1, dtype=np.int64)
+    np.cumsum(np.bincount(rows, minlength=size), out=offsets[1:])
+    return offsets, values[order]
+
+
+# Array backed netlist graph. Nodes and gates are integers, every gate has a type code,
+# input pins a/b (equal for single input gates) and an output node. Fan-out and fan-in
+# are CSR tables with one entry per pin, like Node.inputs and Gate.pins(). Pins are given
+# in fan-out order, pin_number sets the fan-in order when that is a different one.
+class Topology:
+    def __init__(self, node_names, capacitance, gate_names, gate_type, pin_gate, pin_node, out, pin_number=None):
+        self.node_names = NameTable(node_names)
+        self.gate_names = NameTable(gate_names)
+        self.capacitance = np.asarray(capacitance, dtype=float)
+        self.gate_type = np.asarray(gate_type, dtype=np.int8)
+        self.out = np.asarray(out, dtype=np.int32)
+        pin_gate = np.asarray(pin_gate, dtype=np.int32)
+        pin_node = np.asarray(pin_node, dtype=np.int32)
+        nodes = len(self.capacitance)
+        gates = len(self.out)
+
+        fanin_order = None
+        if pin_number is not None:
+            fanin_order = np.lexsort((pin_number, pin_gate))
+        self.fanin_offsets, self.fanin = csr(pin_gate, pin_node, gates, fanin_order)
+        self.fanout_offsets, self.fanout = csr(pin_node, pin_gate, nodes)
+        self.a = self.fanin[self.fanin_offsets[:-1]]
+        self.b = self.fanin[self.fanin_offsets[1:] - 1]
+        self.driver = np.full(nodes, -1, dtype=np.int32)
+        self.driver[self.out] = np.arange(gates, dtype=np.int32)
+        self.levels = None
+
+    @classmethod
+    def from_nodes(cls, nodes, gates=None):
+        if gates is None:
+            gates = [node.output for node in nodes.nodes if node.output]
+        gate_index = dict((gate, i) for i, gate in enumerate(gates))
+        pin_gate = []
+        pin_node = []
+        pin_number = []
+        for node in nodes.nodes:
+            for gate in node.inputs:
+                if gate in gate_index:
+                    pin_gate.append(gate_index[gate])
+                    pin_node.append(node.index)
+                    pin_number.append(0 if node is gate.an else 1)
+        return cls([node.name for node in nodes.nodes], [node.capacitance for node in nodes.nodes],
+                   [gate.id for gate in gates], [CLASS_CODES[type(gate)] for gate in gates],
+                   pin_gate, pin_node, [gate.outputn.index for gate in gates], pin_number)
+
+    @classmethod
+    def from_records(cls, records):
+        # Straight from CircuitRead.parse_circuit records, without any Node or gate objects
+        names = {}
+        capacitance = []
+        gate_names = []
+        gate_type = []
+        pin_gate = []
+        pin_node = []
+        out = []
+        for record in records:
+            if record[0] == 'c':
+                index = names.setdefault(record[1], len(names))
+                capacitance.extend([0] * (len(names) - len(capacitance)))
+                capacitance[index] = record[2]
+                continue
+            for name in record[1]:
+                pin_gate.append(len(gate_names))
+                pin_node.append(names.setdefault(name, len(names)))
+            out.append(names.setdefault(record[2], len(names)))
+            gate_names.append(record[3])
+            gate_type.append(TYPE_CODES[record[0]])
+        capacitance.extend([0] * (len(names) - len(capacitance)))
+        return cls(list(names), capacitance, gate_names, gate_type, pin_gate, pin_node, out)
+
+    def __len__(self):
+        return len(self.capacitance)
+
+    def nbytes(self):
+        arrays = (self.capacitance, self.gate_type, self.out, self.fanin_offsets, self.fanin, self.fanout_offsets,
+                  self.fanout, self.a, self.b, self.driver)
+        return sum(array.nbytes for array in arrays) + self.node_names.nbytes() + self.gate_names.nbytes()
+
+    def fanout_gates(self, node):
+        return self.fanout[self.fanout_offsets[node]:self.fanout_offsets[node + 1]]
+
+    def fanin_nodes(self, gate):
+        return self.fanin[self.fanin_offsets[gate]:self.fanin_offsets[gate + 1]]
+
+    def inputs(self):
+        return np.flatnonzero(self.driver < 0)
+
+    def outputs(self):
+        return np.flatnonzero(np.diff(self.fanout_offsets) == 0)
+
+    def levelize(self):
+        # Groups the gates by level, level 1 being the gates fed by inputs only
+        if self.levels is not None:
+            return self.levels
+        fanout_offsets = self.fanout_offsets.tolist()
+        fanout = self.fanout.tolist()
+        fanin_offsets = self.fanin_offsets.tolist()
+        fanin = self.fanin.tolist()
+        out = self.out.tolist()
+        remaining = np.diff(self.fanin_offsets).tolist()
+        node_level = [0] * len(self)
+        gate_level = [0] * len(out)
+        ready = self.inputs().tolist()
+        done = 0
+        while ready:
+            node = ready.pop()
+            for gate in fanout[fanout_offsets[node]:fanout_offsets[node + 1]]:
+                remaining[gate] -= 1
+                if remaining[gate]:
+                    continue
+                level = max(node_level[n] for n in fanin[fanin_offsets[gate]:fanin_offsets[gate + 1]]) + 1
+                gate_level[gate] = level
+                node_level[out[gate]] = level
+                ready.append(out[gate])
+                done += 1
+        if done < len(out):
+            stuck = [self.gate_names[gate] for gate in range(len(out)) if remaining[gate]]
+            raise ValueError('Combinational loop through gates ' + ' '.join(stuck[:10]))
+
+        gate_level = np.array(gate_level, dtype=np.int32)
+        order = np.argsort(gate_level, kind='stable')
+        bounds = np.searchsorted(gate_level[order], np.arange(1, gate_level.max(initial=0) + 2))
+        self.levels = [order[bounds[i]:bounds[i + 1]] for i in range(len(bounds) - 1)]
+        return self.levels
+
+    def node_loads(self, input_c):
+        # Node capacitance plus the input capacitance of every fan-out pin, input_c is per gate
+        values = input_c[..., self.fanout]
+        padding = np.zeros(values.shape[:-1] + (1,))
+        sums = np.add.reduceat(np.concatenate((values, padding), axis=-1), self.fanout_offsets[:-1], axis=-1)
+        return self.capacitance + np.where(np.diff(self.fanout_offsets) > 0, sums, 0)
+
+    def gate_delays(self, vcc, prototypes):
+        # Delays of a netlist whose gates all come from the same templates, prototypes maps a
+        # type code to one gate of that type. Gate delay is linear in the load.
+        d0 = np.zeros(len(TYPE_NAMES))
+        slope = np.zeros(len(TYPE_NAMES))
+        input_c = np.zeros(len(TYPE_NAMES))
+        for code, gate in prototypes.items():
+            d0[code] = gate.calculate_delay(vcc, 0)
+            slope[code] = (gate.calculate_delay(vcc, 1e-12) - d0[code]) / 1e-12
+            input_c[code] = gate.calculate_gc()
+        load = self.node_loads(input_c[self.gate_type])[self.out]
+        return d0[self.gate_type] + slope[self.gate_type] * load
+
+    def propagate(self, delays):
+        # Arrival time at every node, delays may carry leading axes
+        arrival = np.zeros(delays.shape[:-1] + (len(self),))
+        for level in self.levelize():
+            arrival[..., self.out[level]] = (np.maximum(arrival[..., self.a[level]], arrival[..., self.b[level]]) +
+                                             delays[..., level])
+        return arrival
+
+    def critical_path(self, arrival, node):
+        path = []
+        gate = self.driver[node]
+        while gate >= 0:
+            path.append(gate)
+            a = self.a[gate]
+            b = self.b[gate]
+            gate = self.driver[b if arrival[b] > arrival[a] else a]
+        path.reverse()
+        return path
+
+
+def prototypes(tp, tn):
+    # One gate of every type built from the templates, for Topology.gate_delays
+    gates = {}
+    for code, name in enumerate(TYPE_NAMES):
+        gate_class, pins = CircuitRead.GATE_TYPES[name]
+        gates[code] = gate_class(*(('A',) * pins + ('Y', name.upper(), tp, tn)))
+    return gates
@@ -13,81 +13,99 @@ ELECTRON_CHARGE = 1.6e-19
 BOLTZMANN_K = 1.38e-23
 
 
-class Transistor:
-    def __init__(self, name, model, nodes, w, l, transistor_type='N', level=1, uo=800,  tox=100.0,
+CARD_PARAMETERS = ('model', 'transistor_type', 'level', 'uo', 'tox', 'nsub', 'nsubsw', 'nds', 'ld', 'vto',
+                   'plambda', 'lens', 'lend', 'kp', 'xj', 'pgamma', 'cox', 'mj', 'mjsw')
+
+
+# Everything a .MODEL card defines. It is computed once and shared by every
+# transistor built from the same template, so it must not be modified; use
+# replace() to get a variant.
+class ModelCard:
+    __slots__ = ('parameters', 'model', 'type', 'level', 'lens', 'lend', 'uo', 'tox', 'nsub', 'nds', 'nsubsw',
+                 'plambda', 'vto', 'mj', 'mjsw', 'ld', 'cox', 'kp', 'pgamma', 'xj', 'phi', 'pb', 'pbsw', 'cj',
+                 'cjsw', 'cgso', 'cgdo')
+
+    def __init__(self, model, transistor_type='N', level=1, uo=800,  tox=100.0,
                  nsub=1e15, nsubsw=2.1e16, nds=1e20, ld=0.8, vto=1.0, plambda=0.0,
                  lens=10, lend=10, kp=None, xj=None, pgamma=None,
                  cox=None, mj=0.5, mjsw=0.5):
-        # Circuit Information
-        self.id = name
-        self.model = model
-        if nodes:
-            self.drain = nodes[0]
-            self.gate = nodes[1]
-            self.source = nodes[2]
-            self.substrate = nodes[3]
-        else:
-            self.drain = None
-            self.gate = None
-            self.source = None
-            self.substrate = None
+        init = object.__setattr__
+        init(self, 'parameters', (model, transistor_type, level, uo, tox, nsub, nsubsw, nds, ld, vto, plambda,
+                                  lens, lend, kp, xj, pgamma, cox, mj, mjsw))
+        init(self, 'model', model)
 
         # Transistor Properties
-        self.type = transistor_type
-        self.level = level
-        self.lens = lens
-        self.lend = lend
-        self.uo = uo
-        self.tox = tox
-        self.nsub = nsub
-        self.nds = nds
-        self.nsubsw = nsubsw
-        self.plambda = plambda
-        self.vto = vto
-        self.mj = mj
-        self.mjsw = mjsw
-
-        # Dimensions
-        self.w = w
-        self.l = l
-        self.ld = ld
-        self.ars = w * lens * 1e-8
-        self.ard = w * lend * 1e-8
-        self.ps = (w + 2 * lens) * 1e-4
-        self.pd = (w + 2 * lend) * 1e-4
+        init(self, 'type', transistor_type)
+        init(self, 'level', level)
+        init(self, 'lens', lens)
+        init(self, 'lend', lend)
+        init(self, 'uo', uo)
+        init(self, 'tox', tox)
+        init(self, 'nsub', nsub)
+        init(self, 'nds', nds)
+        init(self, 'nsubsw', nsubsw)
+        init(self, 'plambda', plambda)
+        init(self, 'vto', vto)
+        init(self, 'mj', mj)
+        init(self, 'mjsw', mjsw)
+        init(self, 'ld', ld)
 
         # Derived values
-        self.leff = self.l - 2 * self.ld
-
         if cox:
-            self.cox = cox * 1e-8
+            init(self, 'cox', cox * 1e-8)
         else:
-            self.cox = EPSILON_OX / (self.tox * 1e-7)
+            init(self, 'cox', EPSILON_OX / (self.tox * 1e-7))
 
         if kp:
-            self.kp = kp * 1e-6
+            init(self, 'kp', kp * 1e-6)
         else:
-            self.kp = uo * self.cox
-
-        self.k = self.kp * w / l
+            init(self, 'kp', uo * self.cox)
 
         if pgamma:
-            self.pgamma = pgamma
+            init(self, 'pgamma', pgamma)
         else:
-            self.pgamma = self.calculate_gamma()
+            init(self, 'pgamma', self.calculate_gamma())
+
+        init(self, 'phi', self.calculate_phi())
+        init(self, 'pb', self.calculate_pb())
+        init(self, 'pbsw', self.calculate_pbsw())
 
         if xj:
-            self.xj = xj * 1e-4
+            init(self, 'xj', xj * 1e-4)
         else:
-            self.xj = self.calculate_xj()
+            init(self, 'xj', self.calculate_xj())
+
+        init(self, 'cj', self.calculate_cj())
+        init(self, 'cjsw', self.calculate_cjsw())
+        init(self, 'cgso', self.calculate_cgo())
+        init(self, 'cgdo', self.cgso)
 
-        self.phi = self.calculate_phi()
-        self.pb = self.calculate_pb()
-        self.pbsw = self.calculate_pbsw()
-        self.cj = self.calculate_cj()
-        self.cjsw = self.calculate_cjsw()
-        self.cgso = self.calculate_cgo()
-        self.cgdo = self.cgso
+    def __setattr__(self, key, value):
+        raise AttributeError('ModelCard ' + str(self.model) + ' is shared and can not be modified')
+
+    def __reduce__(self):
+        return ModelCard, self.parameters
+
+    def replace(self, **changes):
+        parameters = dict(zip(CARD_PARAMETERS, self.parameters))
+        parameters.update(changes)
+        return ModelCard(**parameters)
+
+    def spice_model(self):
+        if self.type == 'N':
+            fet_type = 'NMOS '
+        elif self.type == 'P':
+            fet_type = 'PMOS '
+        else:
+            fet_type = 'ERROR '
+        spice_string = '.MODEL ' + self.model + ' ' + fet_type + '(VTO=' + str(self.vto) + ' KP='
+        spice_string += '{:.2f}'.format(self.kp * 1e6) + 'U'
+        spice_string += ' GAMMA=' + '{:.2f}'.format(self.pgamma) + ' PHI={:.2f}'.format(abs(self.phi))
+        spice_string += ' PB={:.3f}'.format(self.pb) + ' CJ={:.2E}'.format(self.cj * 1e4)
+        spice_string += ' CJSW={:.2E}'.format(self.cjsw * 1e2) + ' CGSO={:.2E}'.format(self.cgso * 1e2)
+        spice_string += ' CGDO={:.2E}'.format(self.cgdo * 1e2) + ' MJ={:.2f}'.format(self.mj)
+        spice_string += ' MJSW={:.2f}'.format(self.mjsw) + ' LEVEL=' + str(self.level) + ')'
+        return spice_string
 
     def calculate_gamma(self):
         return math.sqrt(2 * EPSILON_SI * ELECTRON_CHARGE * self.nsub) / self.cox
@@ -137,6 +155,54 @@ class Transistor:
     def calculate_cgo(self):
         return self.cox * self.ld * 1e-4
 
+
+class Transistor:
+    __slots__ = ('id', 'card', 'drain', 'gate', 'source', 'substrate', 'w', 'l', 'ars', 'ard', 'ps', 'pd',
+                 'leff', 'k')
+
+    def __init__(self, name, model, nodes, w, l, transistor_type='N', level=1, uo=800,  tox=100.0,
+                 nsub=1e15, nsubsw=2.1e16, nds=1e20, ld=0.8, vto=1.0, plambda=0.0,
+                 lens=10, lend=10, kp=None, xj=None, pgamma=None,
+                 cox=None, mj=0.5, mjsw=0.5, card=None):
+        # Circuit Information
+        self.id = name
+        if nodes:
+            self.drain = nodes[0]
+            self.gate = nodes[1]
+            self.source = nodes[2]
+            self.substrate = nodes[3]
+        else:
+            self.drain = None
+            self.gate = None
+            self.source = None
+            self.substrate = None
+
+        # Model
+        if not card:
+            card = ModelCard(model, transistor_type, level, uo, tox, nsub, nsubsw, nds, ld, vto, plambda, lens,
+                             lend, kp, xj, pgamma, cox, mj, mjsw)
+        self.card = card
+
+        # Dimensions
+        self.set_size(w, l)
+
+    def set_size(self, w, l):
+        card = self.card
+        self.w = w
+        self.l = l
+        self.ars = w * card.lens * 1e-8
+        self.ard = w * card.lend * 1e-8
+        self.ps = (w + 2 * card.lens) * 1e-4
+        self.pd = (w + 2 * card.lend) * 1e-4
+        self.leff = self.l - 2 * card.ld
+        self.k = card.kp * w / l
+
+    def calculate_keq(self, v1, v2):
+        return self.card.calculate_keq(v1, v2)
+
+    def calculate_keqsw(self, v1, v2):
+        return self.card.calculate_keqsw(v1, v2)
+
     def calculate_cdb(self, v1, v2):
         area = self.ard + self.w * self.xj * 1e-4
         return area * self.cj * self.calculate_keq(v1, v2) + self.pd * self.cjsw * self.calculate_keqsw(v1, v2)
@@ -147,23 +213,13 @@ class Transistor:
         ld = self.ld * 1e-4
         return self.cox * w * (l + 2 * ld) + 2 * self.cox * w * ld
 
+    def spice_instance(self):
+        return '{} {} {} {} {} {} L={}U W={}U AS={}P PS={}U AD={}P PD={}U'.format(
+            self.id, self.drain, self.gate, self.source, self.substrate, self.model, self.l, self.w,
+            self.ars * 1e8, self.ps * 1e4, self.ard * 1e8, self.pd * 1e4)
+
     def spice_print(self, print_return):
-        spice_string = self.id + ' ' + self.drain + ' ' + self.gate + ' ' + self.source + ' ' + self.substrate + ' '
-        if self.type == 'N':
-            fet_type = 'NMOS '
-        elif self.type == 'P':
-            fet_type = 'PMOS '
-        else:
-            fet_type = 'ERROR '
-        spice_string += self.model + ' L=' + str(self.l) + 'U W=' + str(self.w) + 'U AS=' + str(self.ars * 1e8)
-        spice_string += 'P PS=' + str(self.ps * 1e4) + 'U AD=' + str(self.ard * 1e8) + 'P PD=' + str(self.pd * 1e4)
-        spice_string += 'U\n.MODEL ' + self.model + ' ' + fet_type + '(VTO=' + str(self.vto) + ' KP='
-        spice_string += '{:.2f}'.format(self.kp * 1e6) + 'U'
-        spice_string += ' GAMMA=' + '{:.2f}'.format(self.pgamma) + ' PHI={:.2f}'.format(abs(self.phi))
-        spice_string += ' PB={:.3f}'.format(self.pb) + ' CJ={:.2E}'.format(self.cj * 1e4)
-        spice_string += ' CJSW={:.2E}'.format(self.cjsw * 1e2) + ' CGSO={:.2E}'.format(self.cgso * 1e2)
-        spice_string += ' CGDO={:.2E}'.format(self.cgdo * 1e2) + ' MJ={:.2f}'.format(self.mj)
-        spice_string += ' MJSW={:.2f}'.format(self.mjsw) + ' LEVEL=' + str(self.level) + ')'
+        spice_string = self.spice_instance() + '\n' + self.card.spice_model()
 
         if print_return:
             print(spice_string)
@@ -171,6 +227,15 @@ class Transistor:
             return spice_string
 
 
+def card_property(name):
+    return property(lambda transistor: getattr(transistor.card, name))
+
+# Model parameters are read from the shared card
+for parameter in ModelCard.__slots__:
+    if parameter != 'parameters':
+        setattr(Transistor, parameter, card_property(parameter))
+
+
 if __name__ == "__main__":
     t1 = Transistor('M1', "NM1", ['VDD', '1', '0', '0'], 5, 2, transistor_type='N', nsub=2e15,
                     nsubsw=4e16, nds=1e19, tox=45, xj=1, lend=10, lens=10)
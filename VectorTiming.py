@@ -0,0 +1,232 @@
+__author__ = 'Manuel'
+
+import numpy as np
+
+import Topology
+
+# Card values the delay equations need
+CARD_FIELDS = ('vto', 'kp', 'cox', 'ld', 'lend', 'xj', 'cj', 'cjsw', 'pb', 'pbsw')
+
+
+# The functions below are the Transistor/Nand delay equations written over arrays.
+# Transistor parameters are dicts of arrays (w, l and CARD_FIELDS) that broadcast
+# against each other and against vcc, so extra leading axes give sweeps for free.
+def calculate_keq(pb, v1, v2):
+    v1 = -v1
+    v2 = -v2
+    x = np.sqrt(pb - v2) - np.sqrt(pb - v1)
+    y = -2 * np.sqrt(pb) / (v2 - v1)
+    return y * x
+
+
+def calculate_cdb(t, v1, v2):
+    area = t['w'] * t['lend'] * 1e-8 + t['w'] * t['xj'] * 1e-4
+    pd = (t['w'] + 2 * t['lend']) * 1e-4
+    return area * t['cj'] * calculate_keq(t['pb'], v1, v2) + pd * t['cjsw'] * calculate_keq(t['pbsw'], v1, v2)
+
+
+def calculate_cg(t):
+    w = t['w'] * 1e-4
+    l = t['l'] * 1e-4
+    ld = t['ld'] * 1e-4
+    return t['cox'] * w * (l + 2 * ld) + 2 * t['cox'] * w * ld
+
+
+def calculate_gc(p, n):
+    return calculate_cg(p) + calculate_cg(n)
+
+
+def calculate_int_load_c(p, n, v1, v2):
+    cload = 2 * calculate_cdb(p, v1, v2) + 3 * calculate_cdb(n, v1, v2)
+    return cload + calculate_cg(p) + calculate_cg(n)
+
+
+def calculate_tphl(p, n, vcc, cload):
+    cload = cload + calculate_int_load_c(p, n, vcc, vcc * 0.5)
+    v_dif = vcc - n['vto']
+    v_div = n['vto'] / v_dif
+    f_div = cload / (0.5 * n['w'] / n['l'] * n['kp'] * v_dif)
+    return f_div * (2 * v_div + np.log(4 * v_dif / vcc - 1))
+
+
+def calculate_tplh(p, n, vcc, cload):
+    cload = cload + calculate_int_load_c(p, n, 0, vcc * 0.5)
+    v_dif = vcc - np.abs(p['vto'])
+    v_div = np.abs(p['vto']) / v_dif
+    f_div = cload / (p['w'] / p['l'] * p['kp'] * v_dif)
+    return f_div * (2 * v_div + np.log(4 * v_dif / vcc - 1))
+
+
+def calculate_delay(p, n, vcc, cload):
+    return (calculate_tplh(p, n, vcc, cload) + calculate_tphl(p, n, vcc, cload)) / 2
+
+
+def card_table(cards):
+    return dict((field, np.array([getattr(card, field) for card in cards])) for field in CARD_FIELDS)
+
+
+def take(t, index):
+    return dict((key, value[..., index]) for key, value in t.items())
+
+
+def segment_sum(values, offsets):
+    # Sums values[..., offsets[i]:offsets[i + 1]] along the last axis, empty segments give 0
+    padding = np.zeros(np.shape(values)[:-1] + (1,))
+    sums = np.add.reduceat(np.concatenate((values, padding), axis=-1), offsets[:-1], axis=-1)
+    return np.where(np.diff(offsets) > 0, sums, 0)
+
+
+def unique_index(items, table, index):
+    # Position of every item in table, appending the ones not seen yet
+    positions = []
+    for item in items:
+        if item not in index:
+            index[item] = len(table)
+            table.append(item)
+        positions.append(index[item])
+    return np.array(positions, dtype=np.intp)
+
+
+# Struct of arrays copy of a NodeContainer. Gates are split into their nand stages,
+# every nand gets a row of transistor parameters and the arrival times are propagated
+# one level of gates at a time.
+class VectorTiming:
+    def __init__(self, nodes):
+        nodes.organize()
+        self.nodes = nodes
+        self.gates = nodes.levelize()
+
+        # Topology
+        self.topology = Topology.Topology.from_nodes(nodes, self.gates)
+        self.a = self.topology.a
+        self.b = self.topology.b
+        self.out = self.topology.out
+        self.capacitance = self.topology.capacitance
+        self.output_index = np.array([node.index for node in nodes.outputs], dtype=np.intp)
+        self.fanout_offsets = self.topology.fanout_offsets
+        self.fanout = self.topology.fanout
+        self.levels = self.topology.levelize()
+
+        # Nand stages
+        nands = []
+        nand_index = {}
+        stage_nands = []
+        stage_offsets = [0]
+        load_nands = []
+        load_offsets = [0]
+        self.load_factor = []
+        self.external = []
+        input_nands = []
+        self.input_factor = []
+        for gate in self.gates:
+            for nand, loads, factor in gate.stages():
+                stage_nands.append(nand)
+                load_nands.extend(loads)
+                load_offsets.append(len(load_nands))
+                self.load_factor.append(factor)
+                self.external.append(not loads)
+            stage_offsets.append(len(stage_nands))
+            nand, factor = gate.input_load()
+            input_nands.append(nand)
+            self.input_factor.append(factor)
+
+        self.stage_nand = unique_index(stage_nands, nands, nand_index)
+        self.load_nand = unique_index(load_nands, nands, nand_index)
+        self.input_nand = unique_index(input_nands, nands, nand_index)
+        self.stage_offsets = np.array(stage_offsets, dtype=np.intp)
+        self.load_offsets = np.array(load_offsets, dtype=np.intp)
+        self.load_factor = np.array(self.load_factor, dtype=float)
+        self.external = np.array(self.external, dtype=bool)
+        self.input_factor = np.array(self.input_factor, dtype=float)
+        self.stage_gate = np.repeat(np.arange(len(self.gates)), np.diff(self.stage_offsets))
+
+        # Transistor parameters, from the sizing transistors of every nand
+        self.p_cards = []
+        self.n_cards = []
+        sizings = [nand.sizing for nand in nands]
+        self.p_card = unique_index([sizing.tp.card for sizing in sizings], self.p_cards, {})
+        self.n_card = unique_index([sizing.tn.card for sizing in sizings], self.n_cards, {})
+        self.wp = np.array([sizing.tp.w for sizing in sizings], dtype=float)
+        self.lp = np.array([sizing.tp.l for sizing in sizings], dtype=float)
+        self.wn = np.array([sizing.tn.w for sizing in sizings], dtype=float)
+        self.ln = np.array([sizing.tn.l for sizing in sizings], dtype=float)
+
+    def __getstate__(self):
+        # Worker processes only get the arrays, the gate graph stays with the parent
+        state = self.__dict__.copy()
+        state['nodes'] = None
+        state['gates'] = None
+        return state
+
+    def parameters(self, p_cards=None, n_cards=None):
+        # Per nand transistor parameters, optionally with other cards in place of the parsed ones
+        p = take(card_table(p_cards if p_cards else self.p_cards), self.p_card)
+        n = take(card_table(n_cards if n_cards else self.n_cards), self.n_card)
+        p['w'] = self.wp
+        p['l'] = self.lp
+        n['w'] = self.wn
+        n['l'] = self.ln
+        return p, n
+
+    def corner_parameters(self, corners):
+        # Parameters of every (tp, tn) corner stacked on a leading axis. Only the cards of
+        # the corner templates are used, W/L stay the ones of the parsed gates.
+        ps = []
+        ns = []
+        for tp, tn in corners:
+            p, n = self.parameters([tp.card] * len(self.p_cards), [tn.card] * len(self.n_cards))
+            ps.append(p)
+            ns.append(n)
+        p = dict((key, np.stack([q[key] for q in ps])[:, np.newaxis]) for key in ps[0])
+        n = dict((key, np.stack([q[key] for q in ns])[:, np.newaxis]) for key in ns[0])
+        return p, n
+
+    def node_loads(self, gc):
+        return self.topology.node_loads(self.input_factor * gc[..., self.input_nand])
+
+    def gate_delays(self, vcc, p=None, n=None):
+        if p is None or n is None:
+            p, n = self.parameters()
+        gc = calculate_gc(p, n)
+        external_c = self.node_loads(gc)[..., self.out[self.stage_gate]]
+        internal_c = self.load_factor * segment_sum(gc[..., self.load_nand], self.load_offsets)
+        cload = np.where(self.external, external_c, internal_c)
+        stage_delays = calculate_delay(take(p, self.stage_nand), take(n, self.stage_nand), vcc, cload)
+        return segment_sum(stage_delays, self.stage_offsets)
+
+    def propagate(self, vcc, p=None, n=None):
+        return self.topology.propagate(self.gate_delays(vcc, p, n))
+
+    def sweep_delays(self, vccs, corners):
+        # Gate delays as a (corner, vcc, gate) matrix
+        p, n = self.corner_parameters(corners)
+        return self.gate_delays(np.array(vccs, dtype=float)[:, np.newaxis], p, n)
+
+    def sweep(self, vccs, corners):
+        # Worst arrival of every output as a (corner, vcc, output) table
+        p, n = self.corner_parameters(corners)
+        arrival = self.propagate(np.array(vccs, dtype=float)[:, np.newaxis], p, n)
+        return arrival[..., self.output_index]
+
+    def print_sweep(self, table, vccs, corner_names):
+        for c, name in enumerate(corner_names):
+            print(name)
+            print('VCC'.ljust(10) + ''.join(str(node).ljust(14) for node in self.nodes.outputs))
+            for v, vcc in enumerate(vccs):
+                print(str(vcc).ljust(10) + ''.join('{:.4E}'.format(delay).ljust(14) for delay in table[c, v]))
+            print('')
+
+    def worst_arrivals(self, arrival):
+        return [(node, arrival[..., node.index]) for node in self.nodes.outputs]
+
+    def critical_path(self, arrival, node):
+        path = []
+        gate = node.output
+        while gate:
+            path.append(gate)
+            if arrival[gate.bn.index] > arrival[gate.an.index]:
+                gate = gate.bn.output
+            else:
+                gate = gate.an.output
+        path.reverse()
+        return path
@@ -1,6 +1,15 @@
 __author__ = 'Manuel'
 
+import sys
+
 import CircuitRead
+import NetlistImport
+import ParallelTiming
+import Profiler
+import Report
+import Sizing
+import Spice
+import Timing
 import Transistor
 
 
@@ -9,20 +18,86 @@ tp = Transistor.Transistor(None, "PM1", None, 18.6, 1.2, transistor_type='P', ns
                            nsubsw=2.1e16, nds=1e20, tox=60, xj=0.8, vto=-1.0, ld=0.25, uo=1000, cox=6, level=3)
 tn = Transistor.Transistor(None, "NM1", None, 4.7, 1.2, transistor_type='N', nsub=1e15, lens=3.5, lend=3.9,
                            nsubsw=2.1e16, nds=1e20, tox=60, xj=0.8, vto=0.8, ld=0.25, uo=1000, cox=12, level=3)
-new_nodes = CircuitRead.NodeContainer()
-voltage, gates = CircuitRead.read_circuit(filepath, tp, tn, new_nodes)
-
-paths = new_nodes.calculate_paths()
-opaths = new_nodes.organize_by_outputs(paths)
-
-for i, output in enumerate(opaths):
-    print(new_nodes.outputs[i])
-    delays = []
-    for path in output:
-        print(path)
-        delays.append(CircuitRead.path_delays(voltage, path))
-    print(max(delays))
-    print('')
-
-for gate in gates:
-    gate.spice_print()
\ No newline at end of file
+
+if __name__ == "__main__":
+    # --profile prints phase times and counters, --cprofile=<phase> also runs cProfile on one phase.
+    # --parallel[=<processes>] times the output cones in a process pool.
+    # --report=<prefix> streams the paths to CSV and binary column files instead of printing them.
+    # --period=<time> and --required=<node>=<time>[,...] only report the outputs that fail timing,
+    # --size first resizes the gates to meet them.
+    profile_phase = None
+    processes = None
+    report = None
+    period = None
+    required = {}
+    for argument in sys.argv:
+        if argument.startswith('--cprofile='):
+            profile_phase = argument.split('=', 1)[1]
+        if argument.startswith('--parallel='):
+            processes = int(argument.split('=', 1)[1])
+        if argument.startswith('--report='):
+            report = argument.split('=', 1)[1]
+        if argument.startswith('--period='):
+            period = CircuitRead.parse_value(argument.split('=', 1)[1])
+        if argument.startswith('--required='):
+            for constraint in argument.split('=', 1)[1].split(','):
+                name, time = constraint.split('=')
+                required[name] = CircuitRead.parse_value(time)
+    profiler = Profiler.Profiler('--profile' in sys.argv or profile_phase, profile_phase=profile_phase)
+
+    new_nodes = CircuitRead.NodeContainer()
+    with profiler.phase('read_circuit'):
+        if filepath.lower().endswith(tuple(NetlistImport.PARSERS)):
+            voltage, gates = NetlistImport.import_circuit(filepath, tp, tn, new_nodes)
+        else:
+            voltage, gates = CircuitRead.read_circuit(filepath, tp, tn, new_nodes, cache_dir='netlist_cache')
+
+    if '--parallel' in sys.argv or processes:
+        analysis = ParallelTiming.ParallelTiming(new_nodes, voltage)
+        with profiler.phase('parallel'):
+            analysis.run(processes)
+        analysis.print()
+    elif period is not None or required:
+        analysis = Timing.TimingAnalysis(new_nodes, voltage)
+        with profiler.phase('propagate'):
+            analysis.propagate()
+        analysis.constrain(period, required)
+        if '--size' in sys.argv:
+            sizer = Sizing.GateSizer(analysis, period, required)
+            with profiler.phase('sizing'):
+                sizer.run()
+            sizer.print()
+        with profiler.phase('violations'):
+            analysis.print_violations()
+    elif '--block' in sys.argv:
+        analysis = Timing.TimingAnalysis(new_nodes, voltage)
+        with profiler.phase('propagate'):
+            analysis.propagate()
+        analysis.print()
+    elif report:
+        with profiler.phase('report'):
+            with Report.ReportWriter(report) as writer:
+                Report.write_paths(writer, new_nodes, voltage, CircuitRead.TimingCache())
+    else:
+        cache = CircuitRead.TimingCache()
+        with profiler.phase('calculate_paths'):
+            paths = new_nodes.calculate_paths()
+        with profiler.phase('organize_by_outputs'):
+            opaths = new_nodes.organize_by_outputs(paths)
+
+        with profiler.phase('path_delays'):
+            for i, output in enumerate(opaths):
+                print(new_nodes.outputs[i])
+                delays = []
+                for path in output:
+                    print(path)
+                    delays.append(CircuitRead.path_delays(voltage, path, cache))
+                print(max(delays))
+                print('')
+
+    with profiler.phase('spice'):
+        Spice.write_deck(filepath + '.cir', gates, voltage)
+
+    if profiler.enabled:
+        profiler.print()
+        profiler.disable()